@@ -0,0 +1,126 @@
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+
+from PIL import Image
+
+from .docstore import CHUNK_SIZE
+
+# Metadata extraction and previews for stored documents, run by the
+# background document jobs (see jobs.py), never in the upload request.
+
+MAGIC_NUMBERS = [
+    (b'%PDF-', 'application/pdf'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+]
+EXTENSION_TYPES = {
+    'pdf': 'application/pdf',
+    'png': 'image/png',
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+}
+# "/Type /Page" but not "/Type /Pages"; may straddle a chunk boundary
+PDF_PAGE = re.compile(rb'/Type\s*/Page(?![a-zA-Z])')
+
+class DocumentInvalid(Exception):
+    pass
+
+def sniff_type(path):
+    with open(path, 'rb') as f:
+        head = f.read(16)
+    for magic, mime in MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return mime
+    return None
+
+def declared_type(filename):
+    extension = filename.rsplit('.', 1)[-1].lower() if filename and '.' in filename else ''
+    return EXTENSION_TYPES.get(extension)
+
+def checksum(path):
+    """Return (sha256 hex digest, size) of the file, read in chunks."""
+    sha256 = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            sha256.update(chunk)
+            size += len(chunk)
+    return sha256.hexdigest(), size
+
+def pdf_page_count(path):
+    pages = 0
+    tail = b''
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            data = tail + chunk
+            matches = list(PDF_PAGE.finditer(data))
+            # Matches ending in the carried-over tail were counted last round
+            pages += sum(1 for match in matches if match.end() > len(tail))
+            tail = data[-32:]
+    return pages
+
+def make_thumbnail(path, mime, dest, size):
+    """Write a PNG preview of at most size x size to `dest`; False if not possible."""
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(dest), suffix='.png')
+    os.close(fd)
+    try:
+        if mime == 'application/pdf':
+            # First page via poppler, when it is installed
+            if not shutil.which('pdftoppm'):
+                return False
+            subprocess.run(['pdftoppm', '-png', '-singlefile', '-f', '1', '-l', '1',
+                            '-scale-to', str(size), path, tmp_path[:-4]],
+                           check=True, timeout=60, capture_output=True)
+        else:
+            try:
+                image = Image.open(path)
+                image.draft('RGB', (size, size))  # JPEGs decode at reduced scale
+                image.load()
+            except (OSError, Image.DecompressionBombError) as e:
+                raise DocumentInvalid(f'unreadable image: {e}')
+            with image:
+                image.thumbnail((size, size))
+                if image.mode not in ('RGB', 'RGBA', 'L'):
+                    image = image.convert('RGB')
+                image.save(tmp_path, 'PNG')
+        os.replace(tmp_path, dest)
+        return True
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def inspect_document(path, filename, expected_sha256, thumbnail_path, thumbnail_size):
+    """Verify a stored document and collect its metadata.
+
+    Raises DocumentInvalid when the content doesn't match its checksum or its
+    declared (extension) type.
+    """
+    digest, size = checksum(path)
+    if expected_sha256 and digest != expected_sha256:
+        raise DocumentInvalid('checksum mismatch')
+    mime = sniff_type(path)
+    declared = declared_type(filename)
+    if mime is None or (declared and mime != declared):
+        raise DocumentInvalid(f'content is {mime or "unknown"}, declared {declared or "unknown"}')
+    if mime == 'application/pdf':
+        pages = pdf_page_count(path)
+    else:
+        pages = 1
+    has_thumbnail = make_thumbnail(path, mime, thumbnail_path, thumbnail_size)
+    return {
+        'size': size,
+        'mime': mime,
+        'pages': pages,
+        'thumbnail': thumbnail_path if has_thumbnail else None,
+    }
@@ -0,0 +1,67 @@
+import hashlib
+import os
+import tempfile
+
+CHUNK_SIZE = 64 * 1024
+
+class DocumentStore:
+    """Content-addressed blob store for uploaded documents.
+
+    Blobs live at <root>/<aa>/<bb>/<sha256>, so no directory grows past a few
+    thousand entries even with millions of documents. Uploads are streamed in
+    CHUNK_SIZE pieces into a temp file on the same filesystem while hashing,
+    then renamed into place; identical content is only stored once. Reference
+    counts live in the StoredDocument table (see models.py).
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.tmp_dir = os.path.join(root, 'tmp')
+
+    def path_for(self, digest):
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def stage(self, stream):
+        """Write `stream` to a temp file; returns (temp path, sha256 hex digest, size).
+
+        Call place() once the blob's StoredDocument row is locked, or
+        discard() to give up.
+        """
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        sha256 = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    sha256.update(chunk)
+                    tmp.write(chunk)
+                    size += len(chunk)
+                tmp.flush()
+                os.fsync(tmp.fileno())
+            return tmp_path, sha256.hexdigest(), size
+        except BaseException:
+            self.discard(tmp_path)
+            raise
+
+    def place(self, tmp_path, digest):
+        """Move a staged file into the store, or drop it if the blob exists."""
+        path = self.path_for(digest)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+
+    def discard(self, tmp_path):
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    def delete(self, digest):
+        try:
+            os.remove(self.path_for(digest))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,66 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+import bcrypt
+
+# bcrypt runs on a bounded pool so a burst of logins can only occupy
+# `workers` threads; callers beyond `max_pending` wait up to `wait` seconds
+# and then get HashPoolBusy, which the app turns into a 503.
+
+class HashPoolBusy(Exception):
+    pass
+
+class PasswordHasher:
+    def __init__(self):
+        self.rounds = 12
+        self.wait = 5.0
+        self.workers = 4
+        self.executor = None
+        self.slots = None
+        if hasattr(os, 'register_at_fork'):
+            # Forked workers can't use the parent's pool threads
+            os.register_at_fork(after_in_child=self._reset_pool)
+
+    def _reset_pool(self):
+        if self.executor is not None:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hash')
+
+    def init_app(self, app):
+        app.config.setdefault('BCRYPT_LOG_ROUNDS', 12)
+        app.config.setdefault('PASSWORD_HASH_WORKERS', 4)
+        app.config.setdefault('PASSWORD_HASH_MAX_PENDING', 64)
+        app.config.setdefault('PASSWORD_HASH_WAIT', 5.0)
+        self.rounds = int(app.config['BCRYPT_LOG_ROUNDS'])
+        self.wait = float(app.config['PASSWORD_HASH_WAIT'])
+        self.workers = int(app.config['PASSWORD_HASH_WORKERS'])
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.workers,
+            thread_name_prefix='password-hash'
+        )
+        self.slots = threading.BoundedSemaphore(int(app.config['PASSWORD_HASH_MAX_PENDING']))
+
+    def _run(self, fn, *args):
+        if self.executor is None:
+            return fn(*args)
+        if not self.slots.acquire(timeout=self.wait):
+            raise HashPoolBusy()
+        try:
+            return self.executor.submit(fn, *args).result()
+        finally:
+            self.slots.release()
+
+    def hash(self, password):
+        salt = bcrypt.gensalt(self.rounds)
+        return self._run(bcrypt.hashpw, password.encode('utf-8'), salt).decode('utf-8')
+
+    def verify(self, password_hash, password):
+        return self._run(bcrypt.checkpw, password.encode('utf-8'), password_hash.encode('utf-8'))
+
+    def needs_rehash(self, password_hash):
+        # bcrypt hashes look like "$2b$<rounds>$<salt+hash>"
+        try:
+            return int(password_hash.split('$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,148 @@
+from datetime import datetime, timedelta
+import logging
+import os
+import threading
+import traceback
+
+from .docmeta import DocumentInvalid, inspect_document
+from .models import DocumentJob, ImmunizationRecord, db
+
+logger = logging.getLogger(__name__)
+
+# Uploads only store the bytes and queue a DocumentJob row; a small pool of
+# threads in each worker process claims queued jobs, inspects the document
+# and writes the results onto its ImmunizationRecord. Jobs are rows in the
+# database, so a restart loses nothing: queued jobs are picked up by the next
+# poll and jobs left running by a dead process are requeued after
+# DOCUMENT_JOB_TIMEOUT, until they reach DOCUMENT_JOB_MAX_ATTEMPTS.
+
+class DocumentWorker:
+    def __init__(self):
+        self.app = None
+        self.workers = 2
+        self._wakeup = threading.Event()
+        self._threads = []
+        self._start_lock = threading.Lock()
+        if hasattr(os, 'register_at_fork'):
+            # Threads don't survive fork(); forked workers start their own
+            os.register_at_fork(after_in_child=self._reset)
+
+    def init_app(self, app):
+        app.config.setdefault('DOCUMENT_WORKERS', int(os.environ.get('DOCUMENT_WORKERS', 2)))
+        app.config.setdefault('DOCUMENT_JOB_POLL_INTERVAL', 5.0)  # seconds
+        app.config.setdefault('DOCUMENT_JOB_TIMEOUT', 300)  # seconds before a running job is retried
+        app.config.setdefault('DOCUMENT_JOB_MAX_ATTEMPTS', 3)
+        app.config.setdefault('THUMBNAIL_FOLDER', os.path.join('uploads', 'thumbs'))
+        app.config.setdefault('THUMBNAIL_SIZE', 256)
+        self.app = app
+        self.workers = int(app.config['DOCUMENT_WORKERS'])
+        # Start on the first request, i.e. in the serving process rather
+        # than in a preloading parent
+        app.before_request(self._ensure_started)
+
+    def notify(self):
+        """Wake an idle thread; call after committing a new job."""
+        self._ensure_started()
+        self._wakeup.set()
+
+    def _reset(self):
+        self._wakeup = threading.Event()
+        self._threads = []
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._threads or not self.workers:
+            return
+        with self._start_lock:
+            if not self._threads:
+                for i in range(self.workers):
+                    thread = threading.Thread(target=self._run, name=f'document-worker-{i}', daemon=True)
+                    thread.start()
+                    self._threads.append(thread)
+
+    def _run(self):
+        poll_interval = self.app.config['DOCUMENT_JOB_POLL_INTERVAL']
+        while True:
+            try:
+                with self.app.app_context():
+                    job_id = self._claim()
+                    if job_id is not None:
+                        self._process(job_id)
+                        continue
+            except Exception as e:
+                logger.error(f"Document worker error: {str(e)}")
+                logger.error(traceback.format_exc())
+            self._wakeup.wait(poll_interval)
+            self._wakeup.clear()
+
+    def _claim(self):
+        """Mark the oldest runnable job as running and return its id, or None."""
+        now = datetime.utcnow()
+        stale = DocumentJob.query.filter(
+            DocumentJob.status == 'running',
+            DocumentJob.started_at < now - timedelta(seconds=self.app.config['DOCUMENT_JOB_TIMEOUT']))
+        # A job whose process keeps dying gets the same attempt limit as one
+        # that keeps raising
+        max_attempts = self.app.config['DOCUMENT_JOB_MAX_ATTEMPTS']
+        exhausted = stale.filter(DocumentJob.attempts >= max_attempts)
+        record_ids = [record_id for record_id, in exhausted.with_entities(DocumentJob.record_id)]
+        if record_ids:
+            ImmunizationRecord.query.filter(ImmunizationRecord.id.in_(record_ids)).update(
+                {ImmunizationRecord.document_status: 'failed'}, synchronize_session=False)
+        exhausted.update({
+            DocumentJob.status: 'failed',
+            DocumentJob.error: 'timed out',
+            DocumentJob.finished_at: now
+        }, synchronize_session=False)
+        stale.filter(DocumentJob.attempts < max_attempts).update(
+            {DocumentJob.status: 'queued'}, synchronize_session=False)
+        db.session.commit()
+        for job_id, in db.session.query(DocumentJob.id).filter(
+                DocumentJob.status == 'queued').order_by(DocumentJob.id).limit(10):
+            # Only one process/thread wins the conditional update
+            claimed = DocumentJob.query.filter(DocumentJob.id == job_id, DocumentJob.status == 'queued').update({
+                DocumentJob.status: 'running',
+                DocumentJob.attempts: DocumentJob.attempts + 1,
+                DocumentJob.started_at: datetime.utcnow()
+            }, synchronize_session=False)
+            db.session.commit()
+            if claimed:
+                return job_id
+        return None
+
+    def _process(self, job_id):
+        job = DocumentJob.query.get(job_id)
+        if job is None:
+            return  # record deleted while the job was queued
+        record = ImmunizationRecord.query.get(job.record_id)
+        try:
+            if record is None or not record.document_path:
+                raise DocumentInvalid('record has no document')
+            digest = record.document_sha256 or str(record.id)
+            thumbnail_path = os.path.join(self.app.config['THUMBNAIL_FOLDER'], digest[:2], digest + '.png')
+            result = inspect_document(record.document_path, record.document_name, record.document_sha256,
+                                      thumbnail_path, int(self.app.config['THUMBNAIL_SIZE']))
+        except DocumentInvalid as e:
+            job.status, job.error = 'done', str(e)
+            if record is not None:
+                record.document_status = 'invalid'
+        except Exception as e:
+            logger.error(f"Document job {job_id} failed: {str(e)}")
+            db.session.rollback()
+            job.error = str(e)
+            if job.attempts < self.app.config['DOCUMENT_JOB_MAX_ATTEMPTS']:
+                job.status = 'queued'
+            else:
+                job.status = 'failed'
+                record.document_status = 'failed'
+        else:
+            job.status, job.error = 'done', None
+            record.document_status = 'ready'
+            record.document_size = result['size']
+            record.document_mime = result['mime']
+            record.document_pages = result['pages']
+            record.document_thumbnail = result['thumbnail']
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+
+document_worker = DocumentWorker()
@@ -1,6 +1,7 @@
 from . import db
+from .hashing import password_hasher
 from datetime import datetime
-import bcrypt
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -12,10 +13,49 @@ class User(db.Model):
     records = db.relationship('ImmunizationRecord', backref='user', lazy=True)
 
     def set_password(self, password):
-        self.password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        return bcrypt.checkpw(password.encode('utf-8'), self.password_hash.encode('utf-8'))
+        return password_hasher.verify(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        return password_hasher.needs_rehash(self.password_hash)
+
+class StoredDocument(db.Model):
+    # One row per unique blob in the DocumentStore, keyed by content hash
+    sha256 = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @classmethod
+    def acquire(cls, sha256, size):
+        """Add a reference to a blob, creating its row on first use."""
+        # One upsert, so concurrent first uploads of the same content can't
+        # both try to insert the row
+        table = cls.__table__
+        upsert = pg_insert(table).values(sha256=sha256, size=size, ref_count=1, created_at=datetime.utcnow())
+        db.session.execute(upsert.on_conflict_do_update(
+            index_elements=[table.c.sha256], set_={'ref_count': table.c.ref_count + 1}))
+
+    @classmethod
+    def release(cls, sha256):
+        """Drop a reference; the row stays until reap() removes it."""
+        cls.query.filter_by(sha256=sha256).update(
+            {cls.ref_count: cls.ref_count - 1}, synchronize_session=False)
+
+    @classmethod
+    def reap(cls, sha256, delete_blob):
+        """Delete the row and call delete_blob(sha256) if nothing references the blob."""
+        # Under the row's lock: a concurrent acquire() waits for it, so an
+        # upload of the same content either keeps the blob or places it again
+        # after it is gone. The caller commits.
+        stored = cls.query.filter_by(sha256=sha256).with_for_update().first()
+        if stored is None or stored.ref_count > 0:
+            return False
+        delete_blob(sha256)
+        db.session.delete(stored)
+        return True
 
 class ImmunizationRecord(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -25,5 +65,31 @@ class ImmunizationRecord(db.Model):
     next_due_date = db.Column(db.Date)
     provider = db.Column(db.String(100))
     document_path = db.Column(db.String(255))
+    document_sha256 = db.Column(db.String(64), db.ForeignKey('stored_document.sha256'), index=True)
+    document_name = db.Column(db.String(255))
+    # Filled in by the background document job (see jobs.py); status is
+    # pending until it runs, then ready, invalid or failed
+    document_status = db.Column(db.String(20))
+    document_size = db.Column(db.BigInteger)
+    document_mime = db.Column(db.String(100))
+    document_pages = db.Column(db.Integer)
+    document_thumbnail = db.Column(db.String(255))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow) 
\ No newline at end of file
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class DocumentJob(db.Model):
+    # Persistent queue of document processing work; rows survive restarts and
+    # are claimed with a conditional UPDATE, so any worker process can run them
+    id = db.Column(db.Integer, primary_key=True)
+    record_id = db.Column(db.Integer, db.ForeignKey('immunization_record.id', ondelete='CASCADE'),
+                          nullable=False, index=True)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_document_job_status_id', 'status', 'id'),
+    ) 
\ No newline at end of file
@@ -1,9 +1,10 @@
-from flask import Flask
+from flask import Flask, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
 import os
 from datetime import timedelta
+from ..hashing import password_hasher, HashPoolBusy
 
 db = SQLAlchemy()
 jwt = JWTManager()
@@ -16,12 +17,37 @@ def create_app():
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'your-secret-key')
     app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'postgresql://postgres:postgres@db:5432/immun_db')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Per-process pool; under gunicorn (wsgi.py) each worker builds its own
+    # after fork. pool_size defaults to the worker's thread count.
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', os.environ.get('WORKER_THREADS', 5))),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 5)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': True,
+    }
+    # Schema DDL belongs to init_db; production workers skip it at startup
+    app.config['AUTO_CREATE_SCHEMA'] = os.environ.get('AUTO_CREATE_SCHEMA', '1') == '1'
     app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY', 'jwt-secret-key')
     app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=1)
+    app.config['BCRYPT_LOG_ROUNDS'] = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 2))
+    # Internal location the front proxy maps to the uploads folder; when set,
+    # documents are served with X-Accel-Redirect instead of by the worker
+    app.config['DOCUMENT_ACCEL_REDIRECT'] = os.environ.get('DOCUMENT_ACCEL_REDIRECT')
     
     # Initialize extensions
     db.init_app(app)
     jwt.init_app(app)
+    password_hasher.init_app(app)
+
+    @app.errorhandler(HashPoolBusy)
+    def handle_hash_pool_busy(error):
+        return jsonify({'error': 'Server busy, try again shortly'}), 503
+    
+    # Background document processing (metadata, type check, thumbnails)
+    from ..jobs import document_worker
+    document_worker.init_app(app)
     
     # Register blueprints
     from .routes.auth import auth_bp
@@ -31,7 +57,8 @@ def create_app():
     app.register_blueprint(records_bp, url_prefix='/api/records')
     
     # Create database tables
-    with app.app_context():
-        db.create_all()
+    if app.config['AUTO_CREATE_SCHEMA']:
+        with app.app_context():
+            db.create_all()
     
     return app 
\ No newline at end of file
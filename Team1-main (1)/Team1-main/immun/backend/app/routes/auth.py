@@ -47,6 +47,10 @@ def login():
     user = User.query.filter_by(username=data['username']).first()
 
     if user and user.check_password(data['password']):
+        # Upgrade hashes made with a different bcrypt cost
+        if user.password_needs_rehash():
+            user.set_password(data['password'])
+            db.session.commit()
         access_token = create_access_token(identity=user.id, expires_delta=timedelta(hours=1))
         return jsonify({
             'access_token': access_token,
@@ -1,17 +1,95 @@
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, request, jsonify, send_file, Response, stream_with_context, url_for, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from ..models import User, ImmunizationRecord, db
+from ..models import User, ImmunizationRecord, StoredDocument, DocumentJob, db
+from ..jobs import document_worker
+from ..docstore import DocumentStore
+from ..serialization import encode, dumps_json, negotiate, row_to_dict
 import os
+import mimetypes
 from werkzeug.utils import secure_filename
 
 records_bp = Blueprint('records', __name__)
 
 UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'pdf', 'png', 'jpg', 'jpeg'}
+document_store = DocumentStore(os.path.join(UPLOAD_FOLDER, 'blobs'))
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 1000
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+# Listings select these columns as plain rows rather than ORM objects; dates
+# stay date/datetime values and are written as ISO 8601 by the encoder
+RECORD_COLUMNS = [
+    ImmunizationRecord.id, ImmunizationRecord.user_id, ImmunizationRecord.vaccine_name,
+    ImmunizationRecord.date_administered, ImmunizationRecord.next_due_date, ImmunizationRecord.provider,
+    ImmunizationRecord.document_path, ImmunizationRecord.document_name, ImmunizationRecord.document_status,
+    ImmunizationRecord.document_size, ImmunizationRecord.document_mime, ImmunizationRecord.document_pages,
+    ImmunizationRecord.created_at
+]
+RECORD_USER_COLUMNS = [User.username, User.email]
+
+def encoded_response(data):
+    """JSON response, or MessagePack if the client's Accept header prefers it."""
+    mimetype = negotiate(request.accept_mimetypes)
+    response = Response(encode(data, mimetype), mimetype=mimetype)
+    response.vary.add('Accept')
+    return response
+
+def list_records(query, serialize=row_to_dict):
+    """Return `query` as a full list, a keyset page or a stream.
+
+    ?limit=N&after=<id> returns one page ordered by id, with the next cursor in
+    the X-Next-Cursor / Link headers. ?stream=ndjson|json streams every row
+    from a server-side cursor so memory stays flat on large tables.
+    """
+    limit = request.args.get('limit', type=int)
+    after = request.args.get('after', type=int)
+    fmt = request.args.get('stream')
+
+    if after is not None:
+        query = query.filter(ImmunizationRecord.id > after)
+    query = query.order_by(ImmunizationRecord.id.asc())
+
+    if fmt:
+        if fmt not in ('ndjson', 'json'):
+            return jsonify({'error': 'stream must be ndjson or json'}), 400
+        rows = query.yield_per(STREAM_BATCH_SIZE)
+
+        def generate():
+            if fmt == 'ndjson':
+                for row in rows:
+                    yield dumps_json(serialize(row)) + b'\n'
+                return
+            yield b'['
+            separator = b''
+            for row in rows:
+                yield separator + dumps_json(serialize(row))
+                separator = b','
+            yield b']'
+
+        mimetype = 'application/x-ndjson' if fmt == 'ndjson' else 'application/json'
+        return Response(stream_with_context(generate()), mimetype=mimetype)
+
+    if limit is None and after is None:
+        return encoded_response([serialize(record) for record in query.all()]), 200
+
+    limit = max(1, min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE))
+    records = query.limit(limit + 1).all()
+    has_more = len(records) > limit
+    records = records[:limit]
+
+    response = encoded_response([serialize(record) for record in records])
+    if has_more:
+        args = request.args.to_dict()
+        args.update(after=records[-1].id, limit=limit)
+        response.headers['X-Next-Cursor'] = str(records[-1].id)
+        response.headers['Link'] = f'<{url_for(request.endpoint, **args)}>; rel="next"'
+    return response, 200
+
 @records_bp.route('/upload', methods=['POST'])
 @jwt_required()
 def upload_record():
@@ -28,39 +106,125 @@ def upload_record():
         return jsonify({'error': 'File type not allowed'}), 400
     
     filename = secure_filename(file.filename)
-    file_path = os.path.join(UPLOAD_FOLDER, f"{current_user_id}_{filename}")
-    file.save(file_path)
+    # Stream into the content-addressed store; identical files share one blob
+    tmp_path, digest, size = document_store.stage(file.stream)
     
-    data = request.form
-    record = ImmunizationRecord(
-        user_id=current_user_id,
-        vaccine_name=data['vaccine_name'],
-        date_administered=data['date_administered'],
-        next_due_date=data.get('next_due_date'),
-        provider=data.get('provider'),
-        document_path=file_path
-    )
+    try:
+        data = request.form
+        record = ImmunizationRecord(
+            user_id=current_user_id,
+            vaccine_name=data['vaccine_name'],
+            date_administered=data['date_administered'],
+            next_due_date=data.get('next_due_date'),
+            provider=data.get('provider'),
+            document_path=document_store.path_for(digest),
+            document_sha256=digest,
+            document_name=filename,
+            document_status='pending'
+        )
+        
+        # acquire() holds the row lock until the commit, so a delete_record
+        # reaping the same blob can't remove it after it is placed
+        StoredDocument.acquire(digest, size)
+        document_store.place(tmp_path, digest)
+        db.session.add(record)
+        db.session.flush()
+        # Metadata, type verification and the thumbnail are done in the background
+        job = DocumentJob(record_id=record.id)
+        db.session.add(job)
+        db.session.commit()
+    except BaseException:
+        db.session.rollback()
+        document_store.discard(tmp_path)
+        raise
+    document_worker.notify()
     
-    db.session.add(record)
-    db.session.commit()
+    return jsonify({
+        'message': 'Record uploaded successfully',
+        'record_id': record.id,
+        'job_id': job.id
+    }), 201
+
+@records_bp.route('/jobs/<int:job_id>', methods=['GET'])
+@jwt_required()
+def get_job(job_id):
+    """Status of a document processing job and the metadata it produced."""
+    current_user_id = get_jwt_identity()
+    row = db.session.query(
+        DocumentJob.id, DocumentJob.status, DocumentJob.attempts, DocumentJob.error,
+        DocumentJob.created_at, DocumentJob.finished_at, DocumentJob.record_id,
+        ImmunizationRecord.user_id, ImmunizationRecord.document_status, ImmunizationRecord.document_size,
+        ImmunizationRecord.document_mime, ImmunizationRecord.document_pages,
+        ImmunizationRecord.document_thumbnail, User.is_admin
+    ).join(ImmunizationRecord, ImmunizationRecord.id == DocumentJob.record_id).outerjoin(
+        User, User.id == current_user_id).filter(DocumentJob.id == job_id).first()
+    if row is None:
+        return jsonify({'error': 'Not found'}), 404
+    if row.user_id != current_user_id and not row.is_admin:
+        return jsonify({'error': 'Unauthorized'}), 403
     
-    return jsonify({'message': 'Record uploaded successfully'}), 201
+    return jsonify({
+        'id': row.id,
+        'status': row.status,
+        'attempts': row.attempts,
+        'error': row.error,
+        'created_at': row.created_at.isoformat(),
+        'finished_at': row.finished_at.isoformat() if row.finished_at else None,
+        'record_id': row.record_id,
+        'document_status': row.document_status,
+        'document_size': row.document_size,
+        'document_mime': row.document_mime,
+        'document_pages': row.document_pages,
+        'has_thumbnail': row.document_thumbnail is not None
+    }), 200
+
+@records_bp.route('/thumbnail/<int:record_id>', methods=['GET'])
+@jwt_required()
+def get_thumbnail(record_id):
+    current_user_id = get_jwt_identity()
+    row = db.session.query(
+        ImmunizationRecord.user_id, ImmunizationRecord.document_thumbnail, User.is_admin
+    ).outerjoin(User, User.id == current_user_id).filter(ImmunizationRecord.id == record_id).first()
+    if row is None or not row.document_thumbnail:
+        return jsonify({'error': 'Not found'}), 404
+    if row.user_id != current_user_id and not row.is_admin:
+        return jsonify({'error': 'Unauthorized'}), 403
+    response = send_file(row.document_thumbnail, mimetype='image/png', conditional=True)
+    response.headers['Cache-Control'] = 'private, max-age=86400'
+    return response
+
+@records_bp.route('/<int:record_id>', methods=['DELETE'])
+@jwt_required()
+def delete_record(record_id):
+    """Delete a record; its stored document is removed once nothing references it."""
+    current_user_id = get_jwt_identity()
+    record = ImmunizationRecord.query.get(record_id)
+    if record is None:
+        return jsonify({'error': 'Not found'}), 404
+    if record.user_id != current_user_id and not User.query.get(current_user_id).is_admin:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    digest, thumbnail = record.document_sha256, record.document_thumbnail
+    DocumentJob.query.filter_by(record_id=record.id).delete(synchronize_session=False)
+    db.session.delete(record)
+    db.session.flush()
+    if digest:
+        StoredDocument.release(digest)
+    db.session.commit()
+
+    # Separately from the delete, so the blob's row lock is held only briefly
+    if digest and StoredDocument.reap(digest, document_store.delete):
+        if thumbnail and os.path.exists(thumbnail):
+            os.remove(thumbnail)
+    db.session.commit()
+    return jsonify({'message': 'Record deleted successfully'}), 200
 
 @records_bp.route('/my-records', methods=['GET'])
 @jwt_required()
 def get_user_records():
     current_user_id = get_jwt_identity()
-    records = ImmunizationRecord.query.filter_by(user_id=current_user_id).all()
-    
-    return jsonify([{
-        'id': record.id,
-        'vaccine_name': record.vaccine_name,
-        'date_administered': record.date_administered.isoformat(),
-        'next_due_date': record.next_due_date.isoformat() if record.next_due_date else None,
-        'provider': record.provider,
-        'document_path': record.document_path,
-        'created_at': record.created_at.isoformat()
-    } for record in records]), 200
+    query = db.session.query(*RECORD_COLUMNS).filter(ImmunizationRecord.user_id == current_user_id)
+    return encoded_response([row_to_dict(row) for row in query.order_by(ImmunizationRecord.id)]), 200
 
 @records_bp.route('/all-records', methods=['GET'])
 @jwt_required()
@@ -71,28 +235,65 @@ def get_all_records():
     if not user.is_admin:
         return jsonify({'error': 'Unauthorized'}), 403
         
-    records = ImmunizationRecord.query.all()
-    
-    return jsonify([{
-        'id': record.id,
-        'user_id': record.user_id,
-        'vaccine_name': record.vaccine_name,
-        'date_administered': record.date_administered.isoformat(),
-        'next_due_date': record.next_due_date.isoformat() if record.next_due_date else None,
-        'provider': record.provider,
-        'document_path': record.document_path,
-        'created_at': record.created_at.isoformat()
-    } for record in records]), 200
+    # ?include=user adds the owner's username/email, joined in the same query
+    if request.args.get('include') == 'user':
+        query = db.session.query(*RECORD_COLUMNS, *RECORD_USER_COLUMNS).join(
+            User, User.id == ImmunizationRecord.user_id)
+        return list_records(query)
+    return list_records(db.session.query(*RECORD_COLUMNS))
 
 @records_bp.route('/document/<int:record_id>', methods=['GET'])
 @jwt_required()
 def get_document(record_id):
+    """Serve a record's document with ETag, If-None-Match and Range support.
+
+    Content-addressed documents use their sha256 as a strong ETag; older ones
+    fall back to send_file's mtime/size tag. When DOCUMENT_ACCEL_REDIRECT is
+    set (e.g. "/protected-uploads/") the transfer is handed to the front proxy
+    with X-Accel-Redirect instead of being streamed by the worker.
+    """
     current_user_id = get_jwt_identity()
-    record = ImmunizationRecord.query.get_or_404(record_id)
+    # Record and the caller's admin flag in one round trip
+    row = db.session.query(
+        ImmunizationRecord.user_id,
+        ImmunizationRecord.document_path,
+        ImmunizationRecord.document_sha256,
+        ImmunizationRecord.document_name,
+        User.is_admin
+    ).outerjoin(User, User.id == current_user_id).filter(ImmunizationRecord.id == record_id).first()
+    if row is None:
+        return jsonify({'error': 'Not found'}), 404
     
-    if not record.user_id == current_user_id:
-        user = User.query.get(current_user_id)
-        if not user.is_admin:
+    if not row.user_id == current_user_id:
+        if not row.is_admin:
             return jsonify({'error': 'Unauthorized'}), 403
     
-    return send_file(record.document_path) 
\ No newline at end of file
+    if not row.document_path:
+        return jsonify({'error': 'Record has no document'}), 404
+
+    etag = row.document_sha256
+    if etag and etag in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+
+    download_name = row.document_name or os.path.basename(row.document_path)
+    accel_prefix = current_app.config.get('DOCUMENT_ACCEL_REDIRECT')
+    if accel_prefix:
+        relative_path = os.path.relpath(row.document_path, UPLOAD_FOLDER).replace(os.sep, '/')
+        response = Response(mimetype=mimetypes.guess_type(download_name)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + relative_path
+        if etag:
+            response.set_etag(etag)
+    else:
+        # conditional=True answers Range and If-None-Match; the file is sent
+        # through wsgi.file_wrapper so the server can use sendfile()
+        response = send_file(
+            row.document_path,
+            download_name=download_name,
+            conditional=True,
+            etag=etag or True
+        )
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response 
\ No newline at end of file
@@ -0,0 +1,13 @@
+"""Gunicorn settings for wsgi.py; override from the environment."""
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_WORKERS', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+# Also the default per-worker DB pool size (see create_app)
+threads = int(os.environ.get('WORKER_THREADS', 5))
+preload_app = True
+timeout = int(os.environ.get('WORKER_TIMEOUT', 60))
+max_requests = int(os.environ.get('MAX_REQUESTS', 10000))
+max_requests_jitter = max_requests // 10
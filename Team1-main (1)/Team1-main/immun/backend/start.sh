@@ -30,5 +30,5 @@ wait_for_db()
 # Initialize the database and create default admin account
 python -c "from app.init_db import init_db; init_db()"
 
-# Start the Flask application
-flask run --host=0.0.0.0 
\ No newline at end of file
+# Start the API under gunicorn: one preloaded master, one worker per core
+exec gunicorn -c gunicorn.conf.py wsgi:app 
\ No newline at end of file
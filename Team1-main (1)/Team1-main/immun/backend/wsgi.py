@@ -0,0 +1,23 @@
+"""Production entry point for the backend under gunicorn.
+
+    python -c "from app.init_db import init_db; init_db()"   # schema, once
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+The app is created once in the gunicorn master (preload_app) without
+running create_all(); workers are forked from it and each opens its own
+connection pool on first use.
+"""
+import os
+
+os.environ.setdefault('AUTO_CREATE_SCHEMA', '0')
+
+from app.routes import create_app, db  # noqa: E402
+
+app = create_app()
+
+# Check the database is reachable before forking, then close the connection
+# so no worker inherits it
+with app.app_context():
+    with db.engine.connect():
+        pass
+    db.engine.dispose()
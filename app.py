@@ -1,24 +1,61 @@
-from flask import Flask, request, jsonify, session
+from flask import Flask, request, jsonify, session, Response, stream_with_context, url_for, g, has_request_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.middleware.proxy_fix import ProxyFix
 import os
-from datetime import datetime, timedelta
+from datetime import datetime, date, timedelta
 import random
 import string
+import click
 import logging
 from functools import wraps
+from itertools import groupby
+import sqlite3
+from sqlalchemy import event, text, tuple_, select, func, extract
+from sqlalchemy.engine import Engine
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql.dml import UpdateBase
 import traceback
+import re
+from schedule import load_rules, due_doses
+from matching import blocking_keys, match_score
+from serialization import encode, dumps_json, negotiate, row_to_dict
+from auditarchive import BloomFilter, format_timestamp, read_segment, summarize, write_segment
+from logging_setup import configure_logging, DroppingQueueHandler
+from ratelimit import MemoryBucketStore, TokenBucketLimiter
+import json
+import csv
+import io
+import zlib
+import hashlib
+import hmac
+import threading
+import time
+import queue
+import atexit
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from bisect import bisect_left
+from difflib import SequenceMatcher
 
 app = Flask(__name__)
+# Number of reverse proxies in front of the app whose X-Forwarded-For/-Proto
+# headers are trusted; without this every client behind the proxy shares
+# its address (and its login rate limit bucket)
+app.config.setdefault('TRUSTED_PROXY_COUNT', int(os.environ.get('TRUSTED_PROXY_COUNT', 0)))
+if app.config['TRUSTED_PROXY_COUNT']:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXY_COUNT'],
+                            x_proto=app.config['TRUSTED_PROXY_COUNT'])
 # Update CORS configuration for local development
 CORS(app, 
      resources={r"/api/*": {
          "origins": ["http://localhost:8080"],
          "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-         "allow_headers": ["Content-Type"],
+         "allow_headers": ["Content-Type", "If-None-Match"],
          "supports_credentials": True,
-         "expose_headers": ["Content-Type", "X-CSRFToken"],
+         "expose_headers": ["Content-Type", "X-CSRFToken", "X-Next-Cursor", "Link", "ETag"],
          "max_age": 120
      }},
      supports_credentials=True)
@@ -33,18 +70,261 @@ app.config['SESSION_COOKIE_PATH'] = '/'
 app.config['SESSION_COOKIE_DOMAIN'] = None
 
 # Configure SQLite database
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///immunization.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///immunization.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+# Database profile. "production" runs SQLite in WAL mode with a busy timeout
+# and a connection pool sized to the number of request threads per worker,
+# so several readers can run alongside one writer without "database is locked".
+app.config['DB_PROFILE'] = os.environ.get('DB_PROFILE', 'development')
+if app.config['DB_PROFILE'] == 'production':
+    app.config['SQLITE_PRAGMAS'] = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': int(os.environ.get('DB_BUSY_TIMEOUT_MS', 5000)),
+        'cache_size': -64000,  # 64 MB
+        'temp_store': 'MEMORY',
+        'mmap_size': 268435456
+    }
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'poolclass': QueuePool,
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', os.environ.get('WORKER_THREADS', 8))),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 4)),
+        'pool_timeout': 30,
+        'pool_pre_ping': True,
+        # No sqlite3 'timeout' here: the busy_timeout pragma (DB_BUSY_TIMEOUT_MS)
+        # is the one lock wait, and it would override it anyway
+        'connect_args': {'check_same_thread': False}
+    }
+else:
+    app.config['SQLITE_PRAGMAS'] = {}
+
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for name, value in app.config['SQLITE_PRAGMAS'].items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
 db = SQLAlchemy(app)
 
-# Configure logging
-logging.basicConfig(
-    filename='app.log',
-    level=logging.DEBUG,  # Change to DEBUG level
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+# Configure logging: JSON lines written by a background thread to a rotating
+# file. LOG_SAMPLE_DEBUG / LOG_SAMPLE_INFO keep that fraction of records.
+app.config.setdefault('LOG_FILE', os.environ.get('LOG_FILE', 'app.log'))
+app.config.setdefault('LOG_LEVEL', os.environ.get('LOG_LEVEL', 'INFO'))
+app.config.setdefault('LOG_SAMPLE_RATES', {
+    'DEBUG': float(os.environ.get('LOG_SAMPLE_DEBUG', 0.01)),
+    'INFO': float(os.environ.get('LOG_SAMPLE_INFO', 1.0)),
+})
+app.config.setdefault('LOG_MAX_BYTES', int(os.environ.get('LOG_MAX_BYTES', 10 * 1024 * 1024)))
+app.config.setdefault('LOG_BACKUP_COUNT', int(os.environ.get('LOG_BACKUP_COUNT', 5)))
+app.config.setdefault('LOG_ROTATE_WHEN', os.environ.get('LOG_ROTATE_WHEN'))
+log_listener = configure_logging(
+    filename=app.config['LOG_FILE'],
+    level=app.config['LOG_LEVEL'],
+    sample_rates=app.config['LOG_SAMPLE_RATES'],
+    max_bytes=app.config['LOG_MAX_BYTES'],
+    backup_count=app.config['LOG_BACKUP_COUNT'],
+    rotate_when=app.config['LOG_ROTATE_WHEN']
 )
 logger = logging.getLogger(__name__)
 
+# Pagination / streaming settings for list endpoints
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 1000
+
+# Patient search settings
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+# Fuzzy hits: mean over query words of the best difflib ratio against a name word
+SEARCH_FUZZY_MIN_SIMILARITY = 0.75
+
+# Bulk import settings
+IMPORT_BATCH_SIZE = 1000
+MAX_IMPORT_ERRORS = 1000  # per-row errors echoed back in the response
+
+# Export settings
+EXPORT_BATCH_SIZE = 2000
+EXPORT_COLUMNS = ['id', 'userId', 'vaccine', 'date', 'dose', 'filename', 'uploader', 'timestamp']
+EXPORT_USER_COLUMNS = ['userName', 'userDob']
+
+# Authenticated principal cache settings. The cache is per process, so a
+# lockout or role change made in one worker reaches the others only when
+# their entry expires; keep the TTL short.
+app.config.setdefault('PRINCIPAL_CACHE_SIZE', 10000)
+app.config.setdefault('PRINCIPAL_CACHE_TTL', 5)  # seconds
+
+# Conditional GET / response cache settings for list endpoints
+app.config.setdefault('RESPONSE_CACHE_SIZE', 1000)
+app.config.setdefault('RESPONSE_CACHE_TTL', 300)  # seconds
+app.config.setdefault('RESPONSE_CACHE_MAX_BODY', 1024 * 1024)  # bytes
+
+# Audit pipeline settings. With AUDIT_ASYNC off every event is committed
+# inline (useful for tests and one-off scripts).
+app.config.setdefault('AUDIT_ASYNC', True)
+app.config.setdefault('AUDIT_QUEUE_SIZE', 10000)
+app.config.setdefault('AUDIT_BATCH_SIZE', 500)
+app.config.setdefault('AUDIT_FLUSH_INTERVAL', 1.0)  # seconds
+
+# Audit archival. `flask archive-audit` moves audit rows older than
+# AUDIT_RETENTION_DAYS out of the live table into gzip segment files under
+# AUDIT_ARCHIVE_DIR, one or more per UTC day and at most AUDIT_SEGMENT_ROWS
+# rows each. /api/audit-logs reads live and archived rows together.
+app.config.setdefault('AUDIT_RETENTION_DAYS', int(os.environ.get('AUDIT_RETENTION_DAYS', 90)))
+app.config.setdefault('AUDIT_ARCHIVE_DIR', os.environ.get('AUDIT_ARCHIVE_DIR')
+                      or os.path.join(app.instance_path, 'audit-archive'))
+app.config.setdefault('AUDIT_SEGMENT_ROWS', 100000)
+
+# Password hashing settings. PASSWORD_HASH_METHOD is a werkzeug method string;
+# stored hashes made with a different method are upgraded on the next login.
+app.config.setdefault('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+app.config.setdefault('PASSWORD_HASH_WORKERS', os.cpu_count() or 2)
+# A caller waiting on the hash pool holds a request thread, so at most half of
+# them (WORKER_THREADS, see gunicorn.conf.py) may queue; the rest are refused
+# quickly rather than starving cheap requests
+app.config.setdefault('PASSWORD_HASH_MAX_PENDING', max(1, int(os.environ.get('WORKER_THREADS', 8)) // 2))
+app.config.setdefault('PASSWORD_HASH_WAIT', 0.5)  # seconds to wait for a slot
+
+# Login throttling. Token buckets per client IP (every attempt) and per
+# username (failed attempts only) are checked before any database or hashing
+# work; *_BURST is the bucket size and *_RATE the refill in attempts per
+# second. LOGIN_RATE_STORE may be set to a shared bucket store (same take()
+# interface as ratelimit.MemoryBucketStore) so that limits hold across worker
+# processes. Behind a reverse proxy set TRUSTED_PROXY_COUNT so the IP buckets
+# see client addresses.
+app.config.setdefault('LOGIN_IP_BURST', int(os.environ.get('LOGIN_IP_BURST', 20)))
+app.config.setdefault('LOGIN_IP_RATE', float(os.environ.get('LOGIN_IP_RATE', 0.5)))
+app.config.setdefault('LOGIN_USER_BURST', int(os.environ.get('LOGIN_USER_BURST', 5)))
+app.config.setdefault('LOGIN_USER_RATE', float(os.environ.get('LOGIN_USER_RATE', 1 / 60)))
+app.config.setdefault('LOGIN_RATE_STORE', None)
+app.config.setdefault('LOGIN_MAX_FAILURES', 5)
+app.config.setdefault('LOGIN_LOCKOUT_MINUTES', 15)
+app.config.setdefault('LOCKOUT_CACHE_SIZE', 10000)
+
+# Instrumentation: per-route timings, SQL statement counts/time, response
+# sizes and password hashing time, exported in Prometheus text format at
+# /api/metrics. Statements slower than SLOW_QUERY_SECONDS go to the
+# "slow_query" logger. Metrics are served to Sysadmin sessions, or to
+# scrapers sending "Authorization: Bearer <METRICS_TOKEN>" when it is set.
+app.config.setdefault('SLOW_QUERY_SECONDS', 0.1)
+app.config.setdefault('METRICS_TOKEN', os.environ.get('METRICS_TOKEN'))
+slow_query_logger = logging.getLogger('slow_query')
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+class Histogram:
+    def __init__(self, name, description, labels, buckets):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        for label_values, counts, total in sorted(items):
+            labels = ','.join(f'{name}="{_escape_label(value)}"'
+                              for name, value in zip(self.labels, label_values))
+            prefix = labels + ',' if labels else ''
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            cumulative += counts[-1]
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {cumulative}')
+            suffix = '{' + labels + '}' if labels else ''
+            lines.append(f'{self.name}_sum{suffix} {total}')
+            lines.append(f'{self.name}_count{suffix} {cumulative}')
+        return '\n'.join(lines)
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+REQUEST_DURATION = Histogram('http_request_duration_seconds', 'Wall time per request.',
+                             ('route', 'method', 'status'), LATENCY_BUCKETS)
+RESPONSE_SIZE = Histogram('http_response_size_bytes', 'Response body size (unstreamed responses).',
+                          ('route',), SIZE_BUCKETS)
+REQUEST_QUERIES = Histogram('db_queries_per_request', 'SQL statements executed per request.',
+                            ('route',), QUERY_COUNT_BUCKETS)
+REQUEST_QUERY_TIME = Histogram('db_query_seconds_per_request', 'Total SQL time per request.',
+                               ('route',), LATENCY_BUCKETS)
+SLOW_QUERIES = Histogram('db_slow_query_duration_seconds', 'Statements slower than SLOW_QUERY_SECONDS.',
+                         (), LATENCY_BUCKETS)
+PASSWORD_HASH_DURATION = Histogram('password_hash_duration_seconds', 'Password hash/verify time.',
+                                   ('operation',), LATENCY_BUCKETS)
+METRICS = [REQUEST_DURATION, RESPONSE_SIZE, REQUEST_QUERIES, REQUEST_QUERY_TIME,
+           SLOW_QUERIES, PASSWORD_HASH_DURATION]
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(connection, cursor, statement, parameters, context, executemany):
+    connection.info.setdefault('query_start', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def stop_query_timer(connection, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - connection.info['query_start'].pop()
+    if has_request_context() and 'sql_count' in g:
+        g.sql_count += 1
+        g.sql_time += elapsed
+    if elapsed >= app.config['SLOW_QUERY_SECONDS']:
+        SLOW_QUERIES.observe(elapsed)
+        slow_query_logger.warning(f"{elapsed * 1000:.1f} ms: {statement}")
+
+@event.listens_for(Engine, 'handle_error')
+def discard_query_timer(context):
+    if context.connection is not None and context.connection.info.get('query_start'):
+        context.connection.info['query_start'].pop()
+
+@app.before_request
+def start_request_metrics():
+    g.request_start = time.perf_counter()
+    g.sql_count = 0
+    g.sql_time = 0.0
+
+@app.after_request
+def record_request_metrics(response):
+    if 'request_start' not in g:
+        return response
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    REQUEST_DURATION.observe(time.perf_counter() - g.request_start,
+                             route, request.method, str(response.status_code))
+    REQUEST_QUERIES.observe(g.sql_count, route)
+    REQUEST_QUERY_TIME.observe(g.sql_time, route)
+    if not response.is_streamed and response.content_length is not None:
+        RESPONSE_SIZE.observe(response.content_length, route)
+    return response
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    token = app.config['METRICS_TOKEN']
+    if not (token and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')):
+        if 'user_id' not in session:
+            return jsonify({'success': False, 'message': 'Authentication required'}), 401
+        account = get_current_account()
+        if not account or account.role != 'Sysadmin':
+            return jsonify({'success': False, 'message': 'Permission denied'}), 403
+    body = '\n'.join(metric.render() for metric in METRICS) + '\n'
+    body += ('# HELP log_records_dropped_total Log records dropped because the log queue was full.\n'
+             '# TYPE log_records_dropped_total counter\n'
+             f'log_records_dropped_total {DroppingQueueHandler.dropped}\n')
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
 # Error handler
 @app.errorhandler(Exception)
 def handle_error(error):
@@ -70,7 +350,7 @@ class Account(db.Model):
     username = db.Column(db.String(50), unique=True, nullable=False)
     password_hash = db.Column(db.String(200), nullable=False)
     role = db.Column(db.String(20), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
     last_login = db.Column(db.DateTime)
     failed_login_attempts = db.Column(db.Integer, default=0)
     is_locked = db.Column(db.Boolean, default=False)
@@ -78,9 +358,9 @@ class Account(db.Model):
 
 class Record(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     vaccine = db.Column(db.String(100), nullable=False)
-    date = db.Column(db.Date, nullable=False)
+    date = db.Column(db.Date, nullable=False, index=True)
     dose = db.Column(db.Integer)
     filename = db.Column(db.String(255))
     uploader = db.Column(db.String(50))
@@ -92,76 +372,477 @@ class AuditLog(db.Model):
     action = db.Column(db.String(100), nullable=False)
     details = db.Column(db.Text)
     ip_address = db.Column(db.String(50))
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    # Every audit query filters on one of these and sorts newest first
+    __table_args__ = (
+        db.Index('ix_audit_log_user_id_timestamp', 'user_id', 'timestamp'),
+        db.Index('ix_audit_log_action_timestamp', 'action', 'timestamp'),
+        db.Index('ix_audit_log_ip_address_timestamp', 'ip_address', 'timestamp'),
+    )
+
+class AuditSegment(db.Model):
+    # Index entry for one archived audit segment file (see auditarchive.py).
+    # Readers check the time range, actions and Bloom filters to decide
+    # whether the file needs to be opened at all.
+    id = db.Column(db.Integer, primary_key=True)
+    path = db.Column(db.String(255), nullable=False, unique=True)  # relative to AUDIT_ARCHIVE_DIR
+    min_timestamp = db.Column(db.DateTime, nullable=False)
+    max_timestamp = db.Column(db.DateTime, nullable=False, index=True)
+    min_id = db.Column(db.Integer, nullable=False)
+    max_id = db.Column(db.Integer, nullable=False)
+    row_count = db.Column(db.Integer, nullable=False)
+    size_bytes = db.Column(db.Integer, nullable=False)
+    actions = db.Column(db.Text, nullable=False)  # JSON list of distinct actions
+    user_bloom = db.Column(db.LargeBinary, nullable=False)
+    ip_bloom = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class DueDose(db.Model):
+    # Next dose each patient is due for, per vaccine, maintained by
+    # recompute_due_doses() so reminder queries are one range scan on due_date
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    vaccine = db.Column(db.String(100), nullable=False)
+    dose = db.Column(db.Integer, nullable=False)
+    due_date = db.Column(db.Date, nullable=False, index=True)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'vaccine', name='uq_due_dose_user_id_vaccine'),
+    )
+
+class CoverageRollup(db.Model):
+    # Patients who first received `dose` of `vaccine` in `period_year`, by
+    # birth year. Maintained by update_coverage_rollups() on every record write.
+    vaccine = db.Column(db.String(100), primary_key=True)
+    dose = db.Column(db.Integer, primary_key=True)
+    birth_year = db.Column(db.Integer, primary_key=True)
+    period_year = db.Column(db.Integer, primary_key=True)
+    patients = db.Column(db.Integer, nullable=False, default=0)
+
+class PopulationRollup(db.Model):
+    # Number of patients per birth year (the coverage denominator)
+    birth_year = db.Column(db.Integer, primary_key=True)
+    patients = db.Column(db.Integer, nullable=False, default=0)
+
+class UserMatchKey(db.Model):
+    # Blocking keys for duplicate-patient detection (see matching.py); only
+    # patients sharing a key are compared. Maintained by find_duplicates().
+    key = db.Column(db.String(64), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True, index=True)
+
+class DuplicateCandidate(db.Model):
+    # A scored pair of possibly-duplicate patients, user_id < other_id
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    other_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    score = db.Column(db.Float, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='open')  # open, dismissed, merged
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'other_id', name='uq_duplicate_candidate_pair'),
+        db.Index('ix_duplicate_candidate_status_id', 'status', 'id'),
+    )
+
+class TableVersion(db.Model):
+    # Per-table write counter, bumped in the same transaction as every
+    # INSERT/UPDATE/DELETE so cached responses can be validated cheaply
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+# Bounded in-process cache with per-entry expiry and LRU eviction
+class TTLCache:
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+# Snapshot of the authenticated Account used for authorization checks. It is
+# a plain tuple so it can be shared across requests without a DB session.
+Principal = namedtuple('Principal', [
+    'account_id', 'user_id', 'username', 'role', 'is_locked', 'lock_until'
+])
+
+principal_cache = TTLCache(app.config['PRINCIPAL_CACHE_SIZE'], app.config['PRINCIPAL_CACHE_TTL'])
+
+# username -> lock_until for locked accounts, so repeated attempts against a
+# locked account are refused without touching the database
+lockout_cache = TTLCache(app.config['LOCKOUT_CACHE_SIZE'], app.config['LOGIN_LOCKOUT_MINUTES'] * 60)
+
+def cache_principal(account):
+    principal = Principal(account.id, account.user_id, account.username,
+                          account.role, account.is_locked, account.lock_until)
+    # Keyed by account id: staff accounts have no user_id
+    principal_cache.set(account.id, principal)
+    return principal
+
+def get_current_account():
+    """Return the Principal for the session's account, or None."""
+    # Kept in flask.g for the request and in principal_cache across requests
+    if 'principal' in g:
+        return g.principal
+    account_id = session.get('account_id')
+    if account_id is None:
+        g.principal = None
+        return None
+    principal = principal_cache.get(account_id)
+    if principal is None:
+        account = db.session.get(Account, account_id)
+        if account is not None:
+            principal = cache_principal(account)
+    g.principal = principal
+    return principal
+
+# Drop cached principals whenever an Account row is written (login, lockout,
+# role changes), so the next lookup reloads it from the database
+@event.listens_for(Account, 'after_insert')
+@event.listens_for(Account, 'after_update')
+@event.listens_for(Account, 'after_delete')
+def invalidate_principal(mapper, connection, account):
+    principal_cache.pop(account.id)
+    g.pop('principal', None)
+    if not account.is_locked:
+        lockout_cache.pop(account.username)
+
+# Bump TableVersion for every table written through SQLAlchemy. The UPDATE
+# runs on the same connection, so it commits or rolls back with the write and
+# other worker processes see it too.
+@event.listens_for(Engine, 'after_execute')
+def bump_table_version(connection, clauseelement, *args):
+    if not isinstance(clauseelement, UpdateBase):
+        return
+    name = clauseelement.table.name
+    if name == TableVersion.__tablename__:
+        return
+    versions = TableVersion.__table__
+    result = connection.execute(
+        versions.update().where(versions.c.name == name).values(version=versions.c.version + 1))
+    if result.rowcount == 0:
+        connection.execute(versions.insert().values(name=name, version=1))
+
+response_cache = TTLCache(app.config['RESPONSE_CACHE_SIZE'], app.config['RESPONSE_CACHE_TTL'])
+
+def cached_response(*tables):
+    """Cache a GET endpoint's body, validated by TableVersion counters (apply inside role_required)."""
+    # Regular users are cached per user, staff per role; streams are never cached
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if request.args.get('stream'):
+                return f(*args, **kwargs)
+            principal = get_current_account()
+            scope = session.get('user_id') if principal is None or principal.role == 'User' else principal.role
+            key = (request.endpoint, scope, tuple(sorted(request.args.items(multi=True))),
+                   negotiate(request.accept_mimetypes))
+            versions = tuple(sorted(db.session.query(TableVersion.name, TableVersion.version)
+                                    .filter(TableVersion.name.in_(tables))))
+            etag = hashlib.sha1(repr((key, versions)).encode()).hexdigest()
+
+            if etag in request.if_none_match:
+                response = Response(status=304)
+            else:
+                cached = response_cache.get(key)
+                if cached is not None and cached[0] == etag:
+                    _, body, mimetype, headers = cached
+                    response = Response(body, mimetype=mimetype, headers=headers)
+                else:
+                    response = app.make_response(f(*args, **kwargs))
+                    if response.status_code != 200 or response.is_streamed:
+                        return response
+                    body = response.get_data()
+                    if len(body) <= app.config['RESPONSE_CACHE_MAX_BODY']:
+                        headers = [(name, value) for name, value in response.headers
+                                   if name in ('X-Next-Cursor', 'Link')]
+                        response_cache.set(key, (etag, body, response.mimetype, headers))
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            response.vary.add('Accept')
+            return response
+        return decorated_function
+    return decorator
+
+# Schema migrations for databases created by older versions of the app.
+# Each entry is (version, description, statements); statements must be
+# idempotent so a fresh create_all() database can run them harmlessly.
+MIGRATIONS = [
+    (1, 'Index hot lookup and sort columns', [
+        'CREATE INDEX IF NOT EXISTS ix_account_user_id ON account (user_id)',
+        'CREATE INDEX IF NOT EXISTS ix_record_user_id ON record (user_id)',
+        'CREATE INDEX IF NOT EXISTS ix_record_date ON record (date)',
+        'CREATE INDEX IF NOT EXISTS ix_audit_log_user_id ON audit_log (user_id)',
+        'CREATE INDEX IF NOT EXISTS ix_audit_log_timestamp ON audit_log (timestamp)',
+    ]),
+    (2, 'Composite audit log indexes for filtered queries', [
+        'CREATE INDEX IF NOT EXISTS ix_audit_log_user_id_timestamp ON audit_log (user_id, timestamp)',
+        'CREATE INDEX IF NOT EXISTS ix_audit_log_action_timestamp ON audit_log (action, timestamp)',
+        'CREATE INDEX IF NOT EXISTS ix_audit_log_ip_address_timestamp ON audit_log (ip_address, timestamp)',
+        # Covered by the (user_id, timestamp) index
+        'DROP INDEX IF EXISTS ix_audit_log_user_id',
+    ]),
+    (3, 'Patient search indexes', [
+        'CREATE INDEX IF NOT EXISTS ix_user_identifier ON user (identifier)',
+        'CREATE INDEX IF NOT EXISTS ix_user_dob ON user (dob)',
+        # Word index for prefix search and trigram index for fuzzy search,
+        # both external-content tables over user.name kept in sync by triggers
+        "CREATE VIRTUAL TABLE IF NOT EXISTS user_name_fts USING fts5("
+        "name, content='user', content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        "CREATE VIRTUAL TABLE IF NOT EXISTS user_name_trigram USING fts5("
+        "name, content='user', content_rowid='id', tokenize='trigram')",
+        'CREATE TRIGGER IF NOT EXISTS user_search_ai AFTER INSERT ON user BEGIN '
+        'INSERT INTO user_name_fts (rowid, name) VALUES (new.id, new.name); '
+        'INSERT INTO user_name_trigram (rowid, name) VALUES (new.id, new.name); END',
+        'CREATE TRIGGER IF NOT EXISTS user_search_ad AFTER DELETE ON user BEGIN '
+        "INSERT INTO user_name_fts (user_name_fts, rowid, name) VALUES ('delete', old.id, old.name); "
+        "INSERT INTO user_name_trigram (user_name_trigram, rowid, name) VALUES ('delete', old.id, old.name); END",
+        'CREATE TRIGGER IF NOT EXISTS user_search_au AFTER UPDATE OF name ON user BEGIN '
+        "INSERT INTO user_name_fts (user_name_fts, rowid, name) VALUES ('delete', old.id, old.name); "
+        "INSERT INTO user_name_trigram (user_name_trigram, rowid, name) VALUES ('delete', old.id, old.name); "
+        'INSERT INTO user_name_fts (rowid, name) VALUES (new.id, new.name); '
+        'INSERT INTO user_name_trigram (rowid, name) VALUES (new.id, new.name); END',
+        # Index users that existed before the triggers
+        "INSERT INTO user_name_fts (user_name_fts) VALUES ('rebuild')",
+        "INSERT INTO user_name_trigram (user_name_trigram) VALUES ('rebuild')",
+    ]),
+]
+
+def run_migrations():
+    """Apply every migration newer than the recorded schema version."""
+    with db.engine.begin() as connection:
+        connection.execute(text('CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)'))
+        current = connection.execute(text('SELECT MAX(version) FROM schema_version')).scalar() or 0
+        for version, description, statements in MIGRATIONS:
+            if version <= current:
+                continue
+            logger.info(f"Applying migration {version}: {description}")
+            for statement in statements:
+                connection.execute(text(statement))
+            connection.execute(text('INSERT INTO schema_version (version) VALUES (:v)'), {'v': version})
+
+@app.cli.command('migrate')
+def migrate_command():
+    """Create missing tables and apply pending schema migrations."""
+    db.create_all()
+    run_migrations()
+    click.echo('Database schema is up to date')
+
+def schema_is_current():
+    """True if every migration has been applied. Runs no DDL."""
+    try:
+        with db.engine.connect() as connection:
+            current = connection.execute(text('SELECT MAX(version) FROM schema_version')).scalar() or 0
+    except Exception:
+        return False
+    return current >= MIGRATIONS[-1][0]
+
+# Multi-worker serving (see wsgi.py): the app is imported and warmed once in
+# the pre-fork master, then workers are forked from it. Threads and pooled
+# connections don't survive fork(), so every child starts its own.
+def warm_up():
+    """Fill in-process caches before workers are forked from this process."""
+    # Only what stays valid: the hasher's method prefix and compiled SQL and
+    # OS-cached pages for the hot lists. principal_cache entries expire in
+    # seconds, so it is left cold
+    password_hasher.needs_rehash('')
+    with app.app_context():
+        db.session.query(
+            User.id, User.name, User.dob, User.identifier, Account.username
+        ).outerjoin(Account, Account.user_id == User.id).order_by(User.id).limit(DEFAULT_PAGE_SIZE).all()
+        Record.query.order_by(Record.id).limit(DEFAULT_PAGE_SIZE).all()
+        AuditLog.query.order_by(AuditLog.timestamp.desc(), AuditLog.id.desc()).limit(DEFAULT_PAGE_SIZE).all()
+        db.session.query(TableVersion.name, TableVersion.version).all()
+        # Close pooled connections so no worker inherits them
+        db.session.remove()
+        db.engine.dispose()
+
+def reinit_after_fork():
+    with app.app_context():
+        # close=False: the parent still owns any inherited connections
+        db.engine.dispose(close=False)
+    password_hasher.reset()
+    audit_writer.reset()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reinit_after_fork)
 
 # Create database tables
 def init_db():
     with app.app_context():
-        # Drop all tables first
-        db.drop_all()
-        # Create all tables
+        # Only creates tables that are missing; existing data is kept
         db.create_all()
+        run_migrations()
         # Initialize with sample data
         initialize_database()
 
+FIRST_NAMES = ['James', 'Mary', 'John', 'Patricia', 'Robert', 'Jennifer', 'Michael', 'Linda', 
+               'William', 'Elizabeth', 'David', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica',
+               'Thomas', 'Sarah', 'Charles', 'Karen', 'Christopher', 'Nancy', 'Daniel', 'Lisa',
+               'Matthew', 'Margaret', 'Anthony', 'Betty', 'Mark', 'Sandra', 'Donald', 'Ashley',
+               'Steven', 'Kimberly', 'Paul', 'Emily', 'Andrew', 'Donna', 'Joshua', 'Michelle']
+LAST_NAMES = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis',
+              'Rodriguez', 'Martinez', 'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson',
+              'Thomas', 'Taylor', 'Moore', 'Jackson', 'Martin', 'Lee', 'Perez', 'Thompson',
+              'White', 'Harris', 'Sanchez', 'Clark', 'Ramirez', 'Lewis', 'Robinson', 'Walker',
+              'Young', 'Allen', 'King', 'Wright', 'Scott', 'Torres', 'Nguyen', 'Hill', 'Flores']
+SEED_VACCINES = ['MMR', 'DTaP', 'Hepatitis B', 'Polio', 'Varicella', 'HPV', 'Influenza', 'COVID-19']
+SEED_ACTIONS = ['LOGIN', 'LOGIN_FAILED', 'LOGOUT', 'REGISTER', 'ADD_RECORD']
+
 # Helper function to generate random names
-def generate_random_name():
-    first_names = ['James', 'Mary', 'John', 'Patricia', 'Robert', 'Jennifer', 'Michael', 'Linda', 
-                  'William', 'Elizabeth', 'David', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica',
-                  'Thomas', 'Sarah', 'Charles', 'Karen', 'Christopher', 'Nancy', 'Daniel', 'Lisa',
-                  'Matthew', 'Margaret', 'Anthony', 'Betty', 'Mark', 'Sandra', 'Donald', 'Ashley',
-                  'Steven', 'Kimberly', 'Paul', 'Emily', 'Andrew', 'Donna', 'Joshua', 'Michelle']
-    last_names = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis',
-                 'Rodriguez', 'Martinez', 'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson',
-                 'Thomas', 'Taylor', 'Moore', 'Jackson', 'Martin', 'Lee', 'Perez', 'Thompson',
-                 'White', 'Harris', 'Sanchez', 'Clark', 'Ramirez', 'Lewis', 'Robinson', 'Walker',
-                 'Young', 'Allen', 'King', 'Wright', 'Scott', 'Torres', 'Nguyen', 'Hill', 'Flores']
-    return f"{random.choice(first_names)} {random.choice(last_names)}"
+def generate_random_name(rng=random):
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
 
 # Initialize database with random users
 def initialize_database():
     with app.app_context():
         # Check if we already have users
         if User.query.count() == 0:
-            # Create 25 random users
-            for i in range(25):
-                # Create user
-                user = User(
-                    name=generate_random_name(),
-                    dob=datetime(1990 + random.randint(0, 30), random.randint(1, 12), random.randint(1, 28)),
-                    identifier=f"ID{random.randint(1000, 9999)}"
-                )
-                db.session.add(user)
-                db.session.flush()  # Get the user ID
-
-                # Create account
-                username = f"user{i+1}"
-                account = Account(
-                    username=username,
-                    password_hash=generate_password_hash("password"),
-                    role="User",
-                    user_id=user.id
-                )
-                db.session.add(account)
-
-            # Create admin accounts
-            admin_roles = ['Admin', 'Sysadmin', 'Frontdesk']
-            for role in admin_roles:
-                account = Account(
-                    username=role.lower(),
-                    password_hash=generate_password_hash("password"),
-                    role=role,
-                    user_id=None
-                )
-                db.session.add(account)
+            # 25 random users plus the Admin/Sysadmin/Frontdesk accounts
+            seed_database(users=25, admin_accounts=True, dedupe=True)
 
-            db.session.commit()
+def _bulk_insert(model, rows):
+    if rows:
+        db.session.execute(model.__table__.insert(), rows)
+        rows.clear()
+
+def seed_database(users=0, records=0, audit_logs=0, seed=None, batch_size=10000,
+                  password='password', admin_accounts=False, dedupe=False):
+    """Bulk-insert synthetic users (with accounts), records and audit rows."""
+    # executemany in `batch_size` batches with one shared password hash; rows
+    # are appended after any existing ones and `seed` makes them reproducible
+    rng = random.Random(seed)
+    password_hash = generate_password_hash(password, method=app.config['PASSWORD_HASH_METHOD'])
+    first_user_id = (db.session.query(db.func.max(User.id)).scalar() or 0) + 1
+    first_account = (db.session.query(db.func.max(Account.id)).scalar() or 0) + 1
+    now = datetime.utcnow()
+
+    user_rows, account_rows = [], []
+    for i in range(users):
+        user_id = first_user_id + i
+        user_rows.append({
+            'id': user_id,
+            'name': generate_random_name(rng),
+            'dob': date(1990 + rng.randint(0, 30), rng.randint(1, 12), rng.randint(1, 28)),
+            'identifier': f"ID{rng.randint(1000, 9999)}"
+        })
+        account_rows.append({
+            'username': f"user{first_account + i}",
+            'password_hash': password_hash,
+            'role': 'User',
+            'user_id': user_id,
+            'failed_login_attempts': 0,
+            'is_locked': False
+        })
+        if len(user_rows) >= batch_size:
+            _bulk_insert(User, user_rows)
+            _bulk_insert(Account, account_rows)
+    _bulk_insert(User, user_rows)
+    _bulk_insert(Account, account_rows)
+
+    if admin_accounts:
+        for role in ['Admin', 'Sysadmin', 'Frontdesk']:
+            account_rows.append({
+                'username': role.lower(),
+                'password_hash': password_hash,
+                'role': role,
+                'user_id': None,
+                'failed_login_attempts': 0,
+                'is_locked': False
+            })
+        _bulk_insert(Account, account_rows)
+
+    last_user_id = first_user_id + users - 1
+    if (records or audit_logs) and last_user_id < 1:
+        raise ValueError('Cannot seed records or audit logs without any users')
+
+    record_rows = []
+    for _ in range(records):
+        record_rows.append({
+            'user_id': rng.randint(1, last_user_id),
+            'vaccine': rng.choice(SEED_VACCINES),
+            'date': date(2000 + rng.randint(0, 24), rng.randint(1, 12), rng.randint(1, 28)),
+            'dose': rng.randint(1, 3),
+            'filename': None,
+            'uploader': 'seed',
+            'timestamp': now - timedelta(seconds=rng.randint(0, 5 * 365 * 86400))
+        })
+        if len(record_rows) >= batch_size:
+            _bulk_insert(Record, record_rows)
+    _bulk_insert(Record, record_rows)
+
+    audit_rows = []
+    for _ in range(audit_logs):
+        audit_rows.append({
+            'user_id': rng.randint(1, last_user_id),
+            'action': rng.choice(SEED_ACTIONS),
+            'details': 'Seeded event',
+            'ip_address': f"10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}",
+            'timestamp': now - timedelta(seconds=rng.randint(0, 365 * 86400))
+        })
+        if len(audit_rows) >= batch_size:
+            _bulk_insert(AuditLog, audit_rows)
+    _bulk_insert(AuditLog, audit_rows)
+
+    rebuild_coverage_rollups()
+    recompute_due_doses()
+    # Duplicate matching dominates large seeds; `flask dedupe` picks the new
+    # users up later when this is off
+    if dedupe:
+        find_duplicates()
+    db.session.commit()
+
+@app.cli.command('seed')
+@click.option('--users', default=1000, help='Number of users (each with an account).')
+@click.option('--records', default=5000, help='Number of immunization records.')
+@click.option('--audit-logs', default=10000, help='Number of audit log rows.')
+@click.option('--seed', default=42, help='Random seed for reproducible data.')
+@click.option('--batch-size', default=10000, help='Rows per INSERT batch.')
+@click.option('--dedupe', is_flag=True, help='Also look for duplicate patients (slow for large seeds).')
+def seed_command(users, records, audit_logs, seed, batch_size, dedupe):
+    """Generate a synthetic benchmark database: flask --app app seed --users 100000"""
+    db.create_all()
+    run_migrations()
+    started = time.perf_counter()
+    seed_database(users=users, records=records, audit_logs=audit_logs,
+                  seed=seed, batch_size=batch_size, dedupe=dedupe)
+    click.echo(f"Seeded {users} users, {records} records and {audit_logs} audit rows "
+               f"in {time.perf_counter() - started:.1f}s")
 
 # Authentication decorator
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if 'user_id' not in session:
+        # Sessions without a live account (issued before account_id was
+        # stored, or whose account is gone) must log in again
+        if 'user_id' not in session or get_current_account() is None:
+            session.clear()
             return jsonify({'success': False, 'message': 'Authentication required'}), 401
         return f(*args, **kwargs)
     return decorated_function
@@ -174,25 +855,632 @@ def role_required(roles):
             if 'user_id' not in session:
                 return jsonify({'success': False, 'message': 'Authentication required'}), 401
             
-            account = Account.query.filter_by(user_id=session['user_id']).first()
+            account = get_current_account()
             if not account or account.role not in roles:
                 return jsonify({'success': False, 'message': 'Permission denied'}), 403
             return f(*args, **kwargs)
         return decorated_function
     return decorator
 
+# Background audit writer: events are queued by request threads and
+# bulk-inserted by a single writer thread, flushed by batch size or interval
+class AuditWriter:
+    _STOP = object()
+
+    def __init__(self, app, batch_size, flush_interval, queue_size):
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, event):
+        self._ensure_started()
+        try:
+            self.queue.put(event, timeout=self.flush_interval)
+        except queue.Full:
+            # Writer can't keep up: apply back-pressure by writing inline
+            logger.warning("Audit queue full, writing event synchronously")
+            self._write([event])
+
+    def flush(self):
+        """Block until every queued event has been written."""
+        if self._thread is not None:
+            self.queue.join()
+
+    def stop(self):
+        """Write out anything still queued and stop the writer thread."""
+        if self._thread is None:
+            return
+        self.queue.put(self._STOP)
+        self._thread.join()
+        self._thread = None
+
+    def reset(self):
+        """Drop the thread and queue inherited from a parent process.
+
+        Called in forked workers: the parent's writer thread does not exist
+        there, and events it had queued are written by the parent.
+        """
+        self.queue = queue.Queue(maxsize=self.queue.maxsize)
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self.queue.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = None
+            stopping = item is self._STOP
+            if item is not None and not stopping:
+                batch.append(item)
+            if batch and (stopping or len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                self._write(batch)
+                for _ in batch:
+                    self.queue.task_done()
+                batch = []
+            if item is None or time.monotonic() >= deadline:
+                deadline = time.monotonic() + self.flush_interval
+            if stopping:
+                self.queue.task_done()
+                return
+
+    def _write(self, batch):
+        try:
+            with self.app.app_context():
+                db.session.execute(AuditLog.__table__.insert(), batch)
+                db.session.commit()
+        except Exception as e:
+            logger.error(f"Audit write of {len(batch)} events failed: {str(e)}")
+            logger.error(traceback.format_exc())
+
+audit_writer = AuditWriter(
+    app,
+    batch_size=app.config['AUDIT_BATCH_SIZE'],
+    flush_interval=app.config['AUDIT_FLUSH_INTERVAL'],
+    queue_size=app.config['AUDIT_QUEUE_SIZE']
+)
+atexit.register(audit_writer.stop)
+
+# Password hashing runs on a bounded worker pool so a burst of logins can
+# only occupy PASSWORD_HASH_WORKERS cores; callers beyond
+# PASSWORD_HASH_MAX_PENDING wait up to PASSWORD_HASH_WAIT and are then refused
+class HashPoolBusy(Exception):
+    pass
+
+class PasswordHasher:
+    def __init__(self, method, workers, max_pending, wait):
+        self.method = method
+        self.wait = wait
+        self.workers = workers
+        self.max_pending = max_pending
+        self._prefix = None
+        self.reset()
+
+    def reset(self):
+        """(Re)create the pool; forked workers can't use the parent's threads."""
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hash')
+        self.slots = threading.BoundedSemaphore(self.max_pending)
+
+    def _run(self, operation, fn, *args, **kwargs):
+        if not self.slots.acquire(timeout=self.wait):
+            raise HashPoolBusy()
+        try:
+            start = time.perf_counter()
+            result = self.executor.submit(fn, *args, **kwargs).result()
+            PASSWORD_HASH_DURATION.observe(time.perf_counter() - start, operation)
+            return result
+        finally:
+            self.slots.release()
+
+    def hash(self, password):
+        return self._run('hash', generate_password_hash, password, method=self.method)
+
+    def verify(self, password_hash, password):
+        return self._run('verify', check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        # werkzeug hashes look like "<method>$<salt>$<hash>", where <method>
+        # has werkzeug's defaults filled in ("scrypt" -> "scrypt:32768:8:1"),
+        # so compare with the prefix of a real hash, made once
+        if self._prefix is None:
+            self._prefix = generate_password_hash('x', method=self.method).split('$', 1)[0]
+        return password_hash.split('$', 1)[0] != self._prefix
+
+password_hasher = PasswordHasher(
+    method=app.config['PASSWORD_HASH_METHOD'],
+    workers=app.config['PASSWORD_HASH_WORKERS'],
+    max_pending=app.config['PASSWORD_HASH_MAX_PENDING'],
+    wait=app.config['PASSWORD_HASH_WAIT']
+)
+
+@app.errorhandler(HashPoolBusy)
+def handle_hash_pool_busy(error):
+    return jsonify({'success': False, 'message': 'Server busy, try again shortly'}), 503
+
+login_rate_store = app.config['LOGIN_RATE_STORE'] or MemoryBucketStore()
+login_ip_limiter = TokenBucketLimiter(login_rate_store, app.config['LOGIN_IP_BURST'], app.config['LOGIN_IP_RATE'])
+login_user_limiter = TokenBucketLimiter(login_rate_store, app.config['LOGIN_USER_BURST'], app.config['LOGIN_USER_RATE'])
+
+def throttle_login(username):
+    """Return a 429 response if this IP or username is out of login attempts."""
+    # Username tokens are only checked here; charge_failed_login() takes them
+    checks = ((login_ip_limiter.allow, f'login:ip:{request.remote_addr}'),
+              (login_user_limiter.check, f'login:user:{username.lower()}'))
+    for take, key in checks:
+        allowed, retry_after = take(key)
+        if not allowed:
+            logger.info("Login throttled", extra={'key': key, 'retry_after': retry_after})
+            response = jsonify({'success': False, 'message': 'Too many login attempts. Try again later.'})
+            response.headers['Retry-After'] = str(int(retry_after) + 1)
+            return response, 429
+    return None
+
+def charge_failed_login(username):
+    login_user_limiter.allow(f'login:user:{username.lower()}')
+
 # Audit logging function
 def log_audit(user_id, action, details, ip_address):
-    log = AuditLog(
-        user_id=user_id,
-        action=action,
-        details=details,
-        ip_address=ip_address
-    )
-    db.session.add(log)
-    db.session.commit()
+    event = {
+        'user_id': user_id,
+        'action': action,
+        'details': details,
+        'ip_address': ip_address,
+        'timestamp': datetime.utcnow()
+    }
+    if app.config['AUDIT_ASYNC']:
+        audit_writer.submit(event)
+    else:
+        db.session.add(AuditLog(**event))
+        db.session.commit()
     logger.info(f"Audit: {action} by user {user_id} - {details}")
 
+# Audit archival: old rows move into immutable segment files (auditarchive.py)
+# indexed by AuditSegment rows, keeping the live audit_log table small
+AUDIT_ARCHIVE_COLUMNS = [AuditLog.id, AuditLog.user_id, AuditLog.action, AuditLog.details,
+                         AuditLog.ip_address, AuditLog.timestamp]
+
+def archive_audit_logs(older_than_days=None):
+    """Move audit rows older than the retention period into segments; returns (rows, segments)."""
+    days = app.config['AUDIT_RETENTION_DAYS'] if older_than_days is None else older_than_days
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    cutoff = today - timedelta(days=days)
+    archive_dir = app.config['AUDIT_ARCHIVE_DIR']
+    archived = segments = 0
+    while True:
+        oldest = db.session.query(func.min(AuditLog.timestamp)).filter(AuditLog.timestamp < cutoff).scalar()
+        if oldest is None:
+            break
+        day_start = oldest.replace(hour=0, minute=0, second=0, microsecond=0)
+        day_end = min(day_start + timedelta(days=1), cutoff)
+        rows = db.session.query(*AUDIT_ARCHIVE_COLUMNS).filter(
+            AuditLog.timestamp >= day_start, AuditLog.timestamp < day_end
+        ).order_by(AuditLog.timestamp, AuditLog.id).limit(app.config['AUDIT_SEGMENT_ROWS']).all()
+        last = rows[-1]
+        # Newest first, as the reader consumes them
+        segment_rows = [[row.id, row.user_id, row.action, row.details, row.ip_address,
+                         format_timestamp(row.timestamp)] for row in reversed(rows)]
+        index = summarize(segment_rows)
+        path = f"{day_start:%Y/%m}/audit-{day_start:%Y%m%d}-{index['min_id']}-{index['max_id']}.jsonl.gz"
+        size = write_segment(os.path.join(archive_dir, path), segment_rows)
+
+        # The file is already fsynced; a crash before this commit only leaves
+        # an unreferenced file, which the next run overwrites
+        db.session.execute(AuditSegment.__table__.delete().where(AuditSegment.path == path))
+        db.session.add(AuditSegment(path=path, size_bytes=size, **index))
+        db.session.execute(AuditLog.__table__.delete().where(
+            AuditLog.timestamp >= day_start,
+            tuple_(AuditLog.timestamp, AuditLog.id) <= tuple_(last.timestamp, last.id)))
+        db.session.commit()
+        archived += len(rows)
+        segments += 1
+        logger.info(f"Archived {len(rows)} audit rows to {path} ({size} bytes)")
+    return archived, segments
+
+@app.cli.command('archive-audit')
+@click.option('--older-than', type=int, default=None,
+              help='Archive rows older than this many days (default AUDIT_RETENTION_DAYS).')
+def archive_audit_command(older_than):
+    """Move old audit log rows into compressed archive segments."""
+    started = time.perf_counter()
+    archived, segments = archive_audit_logs(older_than)
+    click.echo(f"Archived {archived} audit rows into {segments} segments "
+               f"in {time.perf_counter() - started:.1f}s")
+
+def search_audit_archive(user_id=None, action=None, ip=None, start=None, end=None,
+                         before=None, floor=None, limit=100):
+    """Archived audit rows matching the filters, newest first, as ((timestamp, id), row) pairs."""
+    # before/floor are (timestamp, id) keys bounding the rows from above/below
+    segments = AuditSegment.query
+    if start is not None:
+        segments = segments.filter(AuditSegment.max_timestamp >= start)
+    if end is not None:
+        segments = segments.filter(AuditSegment.min_timestamp < end)
+    if before is not None:
+        segments = segments.filter(AuditSegment.min_timestamp <= before[0])
+    if floor is not None:
+        segments = segments.filter(AuditSegment.max_timestamp >= floor[0])
+    start_key = format_timestamp(start) if start is not None else None
+    end_key = format_timestamp(end) if end is not None else None
+    before_key = (format_timestamp(before[0]), before[1]) if before is not None else None
+    floor_key = (format_timestamp(floor[0]), floor[1]) if floor is not None else None
+
+    # Newest segments first; skip those the index rules out and stop once no
+    # remaining segment can beat the rows already found
+    found = []
+    for segment in segments.order_by(AuditSegment.max_timestamp.desc(), AuditSegment.id.desc()):
+        if len(found) >= limit and format_timestamp(segment.max_timestamp) < found[-1][0][0]:
+            break
+        if action and action not in json.loads(segment.actions):
+            continue
+        if user_id is not None and user_id not in BloomFilter.from_bytes(segment.user_bloom):
+            continue
+        if ip and ip not in BloomFilter.from_bytes(segment.ip_bloom):
+            continue
+        matches = []
+        for row in read_segment(os.path.join(app.config['AUDIT_ARCHIVE_DIR'], segment.path)):
+            key = (row[5], row[0])
+            if floor_key is not None and key <= floor_key:
+                break
+            if start_key is not None and row[5] < start_key:
+                break
+            if (before_key is not None and key >= before_key) or (end_key is not None and row[5] >= end_key):
+                continue
+            if ((user_id is not None and row[1] != user_id) or (action and row[2] != action)
+                    or (ip and row[4] != ip)):
+                continue
+            matches.append((key, row))
+            if len(matches) >= limit:
+                break
+        found = sorted(found + matches, reverse=True)[:limit]
+    return found
+
+# Vaccine schedule: rules come from schedule.py (or VACCINE_RULES_FILE)
+VACCINE_RULES = load_rules(os.environ.get('VACCINE_RULES_FILE'))
+SCHEDULE_BATCH_SIZE = 5000
+
+def recompute_due_doses(user_ids=None):
+    """Rebuild DueDose rows for `user_ids`, or for everyone when None; the caller commits."""
+    # One grouped query (latest dose per patient and vaccine), consumed in a
+    # single pass and inserted in SCHEDULE_BATCH_SIZE batches
+    today = date.today()
+    stmt = select(
+        User.id, User.dob, Record.vaccine, func.max(Record.dose), func.max(Record.date)
+    ).outerjoin(Record, Record.user_id == User.id).group_by(User.id, Record.vaccine).order_by(User.id)
+    delete = DueDose.__table__.delete()
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        stmt = stmt.where(User.id.in_(user_ids))
+        delete = delete.where(DueDose.user_id.in_(user_ids))
+    db.session.execute(delete)
+
+    rows = []
+    result = db.session.execute(stmt.execution_options(stream_results=True))
+    for user_id, group in groupby(result, key=lambda row: row[0]):
+        given = {}
+        dob = None
+        for _, dob, vaccine, last_dose, last_date in group:
+            if vaccine is None:
+                continue
+            key = vaccine.lower()
+            previous = given.get(key)
+            if previous is None or (last_dose or 0) > (previous[0] or 0):
+                given[key] = (last_dose, last_date)
+        for vaccine, dose, due_date in due_doses(VACCINE_RULES, dob, given, today):
+            rows.append({'user_id': user_id, 'vaccine': vaccine, 'dose': dose, 'due_date': due_date})
+        if len(rows) >= SCHEDULE_BATCH_SIZE:
+            _bulk_insert(DueDose, rows)
+    _bulk_insert(DueDose, rows)
+
+@app.cli.command('schedule-rebuild')
+def schedule_rebuild_command():
+    """Recompute next due doses for every patient."""
+    started = time.perf_counter()
+    recompute_due_doses()
+    db.session.commit()
+    click.echo(f"Rebuilt due doses for {DueDose.query.count()} patient/vaccine pairs "
+               f"in {time.perf_counter() - started:.1f}s")
+
+# Coverage analytics rollups
+def _add_to_rollups(model, rows):
+    """Add each row's `patients` delta to its rollup cell in one upsert."""
+    if not rows:
+        return
+    table = model.__table__
+    stmt = sqlite_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[column.name for column in table.primary_key],
+        set_={'patients': table.c.patients + stmt.excluded.patients})
+    db.session.execute(stmt, rows)
+
+def update_coverage_rollups(new_records):
+    """Adjust CoverageRollup for records that are about to be inserted.
+
+    `new_records` are dicts with user_id, vaccine, dose and date. A patient is
+    counted once per vaccine/dose, in the year they first received it, so
+    this must run before the rows are written. The caller commits.
+    """
+    first_dates = {}
+    for row in new_records:
+        if row.get('dose') is None:
+            continue
+        key = (row['user_id'], row['vaccine'], row['dose'])
+        if key not in first_dates or row['date'] < first_dates[key]:
+            first_dates[key] = row['date']
+    if not first_dates:
+        return
+
+    user_ids = {key[0] for key in first_dates}
+    existing = {}
+    for user_id, vaccine, dose, first_date in db.session.query(
+            Record.user_id, Record.vaccine, Record.dose, func.min(Record.date)
+    ).filter(Record.user_id.in_(user_ids)).group_by(Record.user_id, Record.vaccine, Record.dose):
+        existing[(user_id, vaccine, dose)] = first_date
+    birth_years = {user_id: dob.year for user_id, dob in
+                   db.session.query(User.id, User.dob).filter(User.id.in_(user_ids))}
+
+    deltas = {}
+    for key, new_date in first_dates.items():
+        user_id, vaccine, dose = key
+        old_date = existing.get(key)
+        if old_date is not None and old_date.year <= new_date.year:
+            continue
+        birth_year = birth_years[user_id]
+        cell = (vaccine, dose, birth_year, new_date.year)
+        deltas[cell] = deltas.get(cell, 0) + 1
+        if old_date is not None:
+            old_cell = (vaccine, dose, birth_year, old_date.year)
+            deltas[old_cell] = deltas.get(old_cell, 0) - 1
+
+    _add_to_rollups(CoverageRollup, [
+        {'vaccine': vaccine, 'dose': dose, 'birth_year': birth_year,
+         'period_year': period_year, 'patients': delta}
+        for (vaccine, dose, birth_year, period_year), delta in deltas.items() if delta
+    ])
+
+def rebuild_coverage_rollups():
+    """Recompute both rollup tables from scratch with GROUP BY. The caller commits."""
+    db.session.execute(CoverageRollup.__table__.delete())
+    db.session.execute(PopulationRollup.__table__.delete())
+
+    first_doses = select(
+        Record.user_id, Record.vaccine, Record.dose, func.min(Record.date).label('first_date')
+    ).where(Record.dose.isnot(None)).group_by(Record.user_id, Record.vaccine, Record.dose).subquery()
+    birth_year = extract('year', User.dob)
+    period_year = extract('year', first_doses.c.first_date)
+    coverage = select(
+        first_doses.c.vaccine, first_doses.c.dose, birth_year, period_year, func.count()
+    ).join(User, User.id == first_doses.c.user_id).group_by(
+        first_doses.c.vaccine, first_doses.c.dose, birth_year, period_year)
+    db.session.execute(CoverageRollup.__table__.insert().from_select(
+        ['vaccine', 'dose', 'birth_year', 'period_year', 'patients'], coverage))
+
+    population = select(birth_year, func.count()).group_by(birth_year)
+    db.session.execute(PopulationRollup.__table__.insert().from_select(
+        ['birth_year', 'patients'], population))
+
+def coverage_cells(user_id):
+    """Return the CoverageRollup cells one patient currently counts towards."""
+    birth_year = db.session.get(User, user_id).dob.year
+    return [(vaccine, dose, birth_year, first_date.year) for vaccine, dose, first_date in
+            db.session.query(Record.vaccine, Record.dose, func.min(Record.date))
+            .filter(Record.user_id == user_id, Record.dose.isnot(None))
+            .group_by(Record.vaccine, Record.dose)]
+
+@app.cli.command('analytics-rebuild')
+def analytics_rebuild_command():
+    """Recompute the coverage analytics rollup tables."""
+    started = time.perf_counter()
+    rebuild_coverage_rollups()
+    db.session.commit()
+    click.echo(f"Rebuilt coverage rollups in {time.perf_counter() - started:.1f}s")
+
+# Duplicate-patient detection: blocking keys and scoring live in matching.py
+DUPLICATE_MIN_SCORE = 0.8
+DUPLICATE_MAX_BLOCK = 200  # larger blocks are too unselective to compare
+DUPLICATE_BATCH_SIZE = 1000
+
+def find_duplicates(user_ids=None):
+    """Refresh blocking keys for `user_ids` and return the number of candidate pairs."""
+    # user_ids=None is an incremental run over patients without keys; the
+    # upsert keeps any dismissed/merged status, and the caller commits
+    if user_ids is None:
+        keyed = select(UserMatchKey.user_id)
+        user_ids = [user_id for user_id, in db.session.query(User.id)
+                    .filter(User.id.notin_(keyed)).order_by(User.id)]
+    else:
+        user_ids = list(user_ids)
+
+    candidate_table = DuplicateCandidate.__table__
+    upsert = sqlite_insert(candidate_table)
+    upsert = upsert.on_conflict_do_update(index_elements=['user_id', 'other_id'],
+                                          set_={'score': upsert.excluded.score})
+    # Key everyone first, so each pair is scored once, in the earlier batch
+    for start in range(0, len(user_ids), DUPLICATE_BATCH_SIZE):
+        batch = user_ids[start:start + DUPLICATE_BATCH_SIZE]
+        db.session.execute(UserMatchKey.__table__.delete().where(UserMatchKey.user_id.in_(batch)))
+        key_rows = []
+        for user in db.session.query(User.id, User.name, User.dob, User.identifier).filter(User.id.in_(batch)):
+            key_rows += [{'key': key, 'user_id': user.id}
+                         for key in blocking_keys(user.name, user.dob, user.identifier)]
+        _bulk_insert(UserMatchKey, key_rows)
+
+    found = 0
+    done = set()
+    for start in range(0, len(user_ids), DUPLICATE_BATCH_SIZE):
+        patients = set(user_ids[start:start + DUPLICATE_BATCH_SIZE])
+        batch_keys = select(UserMatchKey.key).where(UserMatchKey.user_id.in_(patients))
+
+        # Members of every block the batch touches; oversized blocks are skipped
+        blocks = {}
+        for key, user_id in db.session.query(UserMatchKey.key, UserMatchKey.user_id).filter(
+                UserMatchKey.key.in_(batch_keys)):
+            blocks.setdefault(key, []).append(user_id)
+        pairs = set()
+        for members in blocks.values():
+            if len(members) > DUPLICATE_MAX_BLOCK:
+                continue
+            for user_id in members:
+                if user_id not in patients:
+                    continue
+                for other_id in members:
+                    # Pairs with a patient from an earlier batch were scored then
+                    if other_id != user_id and other_id not in done:
+                        pairs.add((min(user_id, other_id), max(user_id, other_id)))
+        others = {user.id: user for user in db.session.query(User.id, User.name, User.dob, User.identifier)
+                  .filter(User.id.in_({user_id for pair in pairs for user_id in pair}))}
+        done.update(patients)
+
+        rows = []
+        for user_id, other_id in pairs:
+            score = match_score(others[user_id], others[other_id], DUPLICATE_MIN_SCORE)
+            if score >= DUPLICATE_MIN_SCORE:
+                rows.append({'user_id': user_id, 'other_id': other_id, 'score': round(score, 4),
+                             'status': 'open', 'created_at': datetime.utcnow()})
+        if rows:
+            found += len(rows)
+            db.session.execute(upsert, rows)
+    return found
+
+@app.cli.command('dedupe')
+@click.option('--full', is_flag=True, help='Re-key and re-score every patient, not just new ones.')
+def dedupe_command(full):
+    """Find possible duplicate patients."""
+    started = time.perf_counter()
+    user_ids = [user_id for user_id, in db.session.query(User.id).order_by(User.id)] if full else None
+    found = find_duplicates(user_ids)
+    db.session.commit()
+    click.echo(f"Found {found} candidate pairs in {time.perf_counter() - started:.1f}s")
+
+# Keyset pagination and streaming helpers for list endpoints
+def parse_page_args():
+    """Read keyset pagination arguments from the query string.
+
+    Returns (limit, after). limit is None when the client did not ask for
+    pagination; after is the id of the last row the client has already seen.
+    """
+    limit = request.args.get('limit', type=int)
+    after = request.args.get('after', type=int)
+    if limit is not None:
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+    elif after is not None:
+        limit = DEFAULT_PAGE_SIZE
+    return limit, after
+
+def paginated_response(query, id_column, serialize, limit, after):
+    """Return one keyset page of `query` as a JSON array.
+
+    The cursor for the next page is sent in the X-Next-Cursor and Link
+    headers so the response body keeps the same shape as the unpaginated one.
+    """
+    if after is not None:
+        query = query.filter(id_column > after)
+    rows = query.order_by(id_column.asc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    response = encoded_response([serialize(row) for row in rows])
+    if has_more:
+        next_cursor = rows[-1].id
+        args = request.args.to_dict()
+        args.update(after=next_cursor, limit=limit)
+        response.headers['X-Next-Cursor'] = str(next_cursor)
+        response.headers['Link'] = f'<{url_for(request.endpoint, **args)}>; rel="next"'
+    return response
+
+def streamed_response(query, id_column, serialize, fmt, after=None):
+    """Stream every row of `query` as NDJSON or a chunked JSON array.
+
+    Rows are fetched from the database in batches of STREAM_BATCH_SIZE so
+    memory stays flat regardless of table size.
+    """
+    if after is not None:
+        query = query.filter(id_column > after)
+    rows = query.order_by(id_column.asc()).yield_per(STREAM_BATCH_SIZE)
+
+    def generate_ndjson():
+        for row in rows:
+            yield dumps_json(serialize(row)) + b'\n'
+
+    def generate_json_array():
+        yield b'['
+        first = True
+        for row in rows:
+            if first:
+                first = False
+                yield dumps_json(serialize(row))
+            else:
+                yield b',' + dumps_json(serialize(row))
+        yield b']'
+
+    if fmt == 'ndjson':
+        return Response(stream_with_context(generate_ndjson()), mimetype='application/x-ndjson')
+    return Response(stream_with_context(generate_json_array()), mimetype='application/json')
+
+def list_response(query, id_column, serialize):
+    """Serve a list endpoint as a full list, a keyset page or a stream.
+
+    ?stream=ndjson|json streams the whole result set; ?limit=/&after= returns
+    one page; with neither the full list is returned as before.
+    """
+    limit, after = parse_page_args()
+    fmt = request.args.get('stream')
+    if fmt:
+        if fmt not in ('ndjson', 'json'):
+            return jsonify({'success': False, 'message': 'stream must be ndjson or json'}), 400
+        return streamed_response(query, id_column, serialize, fmt, after)
+    if limit is not None:
+        return paginated_response(query, id_column, serialize, limit, after)
+    return encoded_response([serialize(row) for row in query.order_by(id_column.asc()).all()])
+
+# List endpoints select these plain columns (labelled with their JSON keys)
+# instead of ORM objects; SQLite formats the dates, so rows need no
+# per-field Python work before encoding
+def sql_date(column):
+    return func.strftime('%Y-%m-%d', column)
+
+def sql_datetime(column):
+    return func.strftime('%Y-%m-%d %H:%M:%S', column)
+
+RECORD_COLUMNS = [
+    Record.id, Record.user_id.label('userId'), Record.vaccine, sql_date(Record.date).label('date'),
+    Record.dose, Record.filename, Record.uploader, sql_datetime(Record.timestamp).label('timestamp')
+]
+RECORD_USER_COLUMNS = [User.name.label('userName'), sql_date(User.dob).label('userDob')]
+USER_COLUMNS = [User.id, User.name, sql_date(User.dob).label('dob'), User.identifier, Account.username]
+AUDIT_LOG_COLUMNS = [
+    AuditLog.id, AuditLog.user_id, AuditLog.action, AuditLog.details, AuditLog.ip_address,
+    sql_datetime(AuditLog.timestamp).label('timestamp')
+]
+
+def encoded_response(data):
+    """JSON response, or MessagePack if the client's Accept header prefers it."""
+    mimetype = negotiate(request.accept_mimetypes)
+    response = Response(encode(data, mimetype), mimetype=mimetype)
+    response.vary.add('Accept')
+    return response
+
+def serialize_user_row(row):
+    return {
+        'id': row.id,
+        'name': row.name,
+        'dob': row.dob.strftime('%Y-%m-%d'),
+        'identifier': row.identifier,
+        'username': row.username
+    }
+
 # API Routes
 @app.route('/api/login', methods=['POST', 'OPTIONS'])
 def login():
@@ -200,19 +1488,31 @@ def login():
         if request.method == 'OPTIONS':
             return '', 200
             
-        logger.debug(f"Login attempt with data: {request.json}")
-        
         data = request.json
-        if not data or 'username' not in data or 'password' not in data:
+        if not isinstance(data, dict) or 'username' not in data or 'password' not in data:
             return jsonify({'success': False, 'message': 'Missing username or password'}), 400
-            
+        logger.debug("Login attempt", extra={'username': data['username'], 'ip': request.remote_addr})
+
+        # Cheap in-memory checks first: known lockouts, then IP/username buckets
+        lock_until = lockout_cache.get(str(data['username']))
+        if lock_until and lock_until > datetime.utcnow():
+            return jsonify({'success': False, 'message': 'Account is locked. Try again later.'}), 401
+        throttled = throttle_login(str(data['username']))
+        if throttled:
+            return throttled
+
         account = Account.query.filter_by(username=data['username']).first()
         
         # Check if account is locked
         if account and account.is_locked and account.lock_until and account.lock_until > datetime.utcnow():
+            lockout_cache.set(account.username, account.lock_until)
             return jsonify({'success': False, 'message': 'Account is locked. Try again later.'}), 401
         
-        if account and check_password_hash(account.password_hash, data['password']):
+        if account and password_hasher.verify(account.password_hash, data['password']):
+            # Upgrade hashes made with an older method or cost
+            if password_hasher.needs_rehash(account.password_hash):
+                account.password_hash = password_hasher.hash(data['password'])
+
             # Reset failed login attempts
             account.failed_login_attempts = 0
             account.is_locked = False
@@ -223,6 +1523,7 @@ def login():
             # Set session
             session.permanent = True
             session['user_id'] = account.user_id
+            session['account_id'] = account.id
             session['role'] = account.role
             
             # Log successful login
@@ -237,18 +1538,23 @@ def login():
             return response
         
         # Increment failed login attempts
+        charge_failed_login(str(data['username']))
         if account:
             account.failed_login_attempts += 1
-            if account.failed_login_attempts >= 5:
+            if account.failed_login_attempts >= app.config['LOGIN_MAX_FAILURES']:
                 account.is_locked = True
-                account.lock_until = datetime.utcnow() + timedelta(minutes=15)
+                account.lock_until = datetime.utcnow() + timedelta(minutes=app.config['LOGIN_LOCKOUT_MINUTES'])
             db.session.commit()
+            if account.is_locked:
+                lockout_cache.set(account.username, account.lock_until)
         
         # Log failed login attempt
         if account:
             log_audit(account.user_id, 'LOGIN_FAILED', 'Failed login attempt', request.remote_addr)
         
         return jsonify({'success': False, 'message': 'Invalid credentials'}), 401
+    except HashPoolBusy:
+        return handle_hash_pool_busy(None)
     except Exception as e:
         logger.error(f"Login error: {str(e)}")
         logger.error(traceback.format_exc())
@@ -270,6 +1576,9 @@ def register():
     if Account.query.filter_by(username=data['username']).first():
         return jsonify({'success': False, 'message': 'Username already exists'}), 400
     
+    # Hash before the flush below takes SQLite's write lock
+    password_hash = password_hasher.hash(data['password'])
+
     # Create user
     user = User(
         name=data['name'],
@@ -282,11 +1591,17 @@ def register():
     # Create account
     account = Account(
         username=data['username'],
-        password_hash=generate_password_hash(data['password']),
+        password_hash=password_hash,
         role='User',
         user_id=user.id
     )
     db.session.add(account)
+    recompute_due_doses([user.id])
+    _add_to_rollups(PopulationRollup, [{'birth_year': user.dob.year, 'patients': 1}])
+    # Only the new patient's blocks are scored, so this stays cheap; staff
+    # review the pairs through /api/users/duplicates
+    if find_duplicates([user.id]):
+        logger.info("Registration matches existing patients", extra={'user_id': user.id})
     db.session.commit()
     
     # Log registration
@@ -297,77 +1612,639 @@ def register():
 @app.route('/api/users', methods=['GET'])
 @login_required
 @role_required(['Admin', 'Sysadmin'])
+@cached_response('user', 'account')
 def get_users():
-    users = User.query.all()
-    return jsonify([{
-        'id': user.id,
-        'name': user.name,
-        'dob': user.dob.strftime('%Y-%m-%d'),
-        'identifier': user.identifier,
-        'username': user.account.username if user.account else None
-    } for user in users])
+    # Select plain columns with the account joined in, so the listing is a
+    # single query instead of one extra SELECT per user for user.account
+    query = db.session.query(*USER_COLUMNS).outerjoin(Account, Account.user_id == User.id)
+    return list_response(query, User.id, row_to_dict)
+
+def fts_phrase(value):
+    return '"' + value.replace('"', '""') + '"'
+
+def trigrams(value):
+    value = value.lower()
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+def fuzzy_trigrams(words):
+    # Trigrams of each word and of its one-letter deletions, so that the
+    # trigram index still finds names after a typo ("jonh" -> "joh")
+    grams = set()
+    for word in words:
+        for variant in {word} | {word[:i] + word[i + 1:] for i in range(len(word))}:
+            grams |= trigrams(variant)
+    return grams
+
+def search_user_rows(match_table, match, limit):
+    return db.session.execute(text(f'''
+        SELECT u.id, u.name, u.dob, u.identifier, a.username
+        FROM {match_table} AS m
+        JOIN user AS u ON u.id = m.rowid
+        LEFT JOIN account AS a ON a.user_id = u.id
+        WHERE {match_table} MATCH :match
+        ORDER BY m.rank
+        LIMIT :limit
+    ''').columns(dob=db.Date), {'match': match, 'limit': limit}).all()
+
+def name_similarity(words, name):
+    # Each query word is compared with its best-matching name word
+    name_words = [word.lower() for word in re.findall(r'\w+', name)]
+    if not words or not name_words:
+        return 0.0
+    return sum(max(SequenceMatcher(None, word, name_word).ratio() for name_word in name_words)
+               for word in words) / len(words)
+
+@app.route('/api/users/search', methods=['GET'])
+@login_required
+@role_required(['Admin', 'Sysadmin', 'Frontdesk'])
+@cached_response('user', 'account')
+def search_users():
+    """Find patients by name (`q`), `identifier` and/or `dob`, best first."""
+    # Name words match as prefixes; unless fuzzy=0, trigram matches fill the
+    # rest of the page so typos still match
+    q = (request.args.get('q') or '').strip()
+    identifier = (request.args.get('identifier') or '').strip()
+    limit = max(1, min(request.args.get('limit', SEARCH_DEFAULT_LIMIT, type=int), SEARCH_MAX_LIMIT))
+    try:
+        dob = datetime.strptime(request.args['dob'], '%Y-%m-%d').date() if request.args.get('dob') else None
+    except ValueError:
+        return jsonify({'success': False, 'message': 'dob must be YYYY-MM-DD'}), 400
+    if not (q or identifier or dob):
+        return jsonify({'success': False, 'message': 'Provide q, identifier or dob'}), 400
+
+    user_rows = db.session.query(
+        User.id, User.name, User.dob, User.identifier, Account.username
+    ).outerjoin(Account, Account.user_id == User.id)
+    words = [word.lower() for word in re.findall(r'\w+', q)]
+    wanted = fuzzy_trigrams(words)
+    fuzzy = request.args.get('fuzzy') != '0'
+
+    hits = []
+    if identifier:
+        query = user_rows.filter(User.identifier == identifier)
+        if dob:
+            query = query.filter(User.dob == dob)
+        if q:
+            query = query.filter(User.name.ilike(f'%{q}%'))
+        hits = [(row, 'identifier') for row in query.order_by(User.id).limit(limit)]
+    elif dob:
+        # A birth date narrows things to a handful of rows; rank those here
+        # rather than ranking every name match in the full-text index
+        scored = []
+        for row in user_rows.filter(User.dob == dob).order_by(User.name, User.id):
+            name_words = [word.lower() for word in re.findall(r'\w+', row.name)]
+            if all(any(name_word.startswith(word) for name_word in name_words) for word in words):
+                scored.append((2.0, row, 'prefix' if words else 'dob'))
+            elif fuzzy and wanted:
+                similarity = name_similarity(words, row.name)
+                if similarity >= SEARCH_FUZZY_MIN_SIMILARITY:
+                    scored.append((similarity, row, 'fuzzy'))
+        scored.sort(key=lambda item: -item[0])
+        hits = [(row, kind) for _, row, kind in scored[:limit]]
+    else:
+        if words:
+            match = ' '.join(fts_phrase(word) + '*' for word in words)
+            hits = [(row, 'prefix') for row in search_user_rows('user_name_fts', match, limit)]
+        if len(hits) < limit and wanted and fuzzy:
+            seen = {row.id for row, _ in hits}
+            match = ' OR '.join(fts_phrase(gram) for gram in sorted(wanted))
+            # Over-fetch by bm25, then keep names similar enough to the query
+            scored = []
+            for row in search_user_rows('user_name_trigram', match, limit * 5):
+                if row.id in seen:
+                    continue
+                similarity = name_similarity(words, row.name)
+                if similarity >= SEARCH_FUZZY_MIN_SIMILARITY:
+                    scored.append((similarity, row))
+            scored.sort(key=lambda item: -item[0])
+            hits += [(row, 'fuzzy') for _, row in scored[:limit - len(hits)]]
+
+    results = []
+    for row, kind in hits:
+        data = serialize_user_row(row)
+        data['match'] = kind
+        results.append(data)
+    return jsonify(results)
+
+def serialize_duplicate_row(row):
+    return {
+        'id': row.id,
+        'userId': row.user_id,
+        'userName': row.user_name,
+        'otherId': row.other_id,
+        'otherName': row.other_name,
+        'score': row.score,
+        'status': row.status
+    }
+
+@app.route('/api/users/duplicates', methods=['GET'])
+@login_required
+@role_required(['Admin', 'Sysadmin'])
+@cached_response('duplicate_candidate', 'user')
+def get_duplicates():
+    """Possible duplicate patients, filtered by status (default open)."""
+    first, other = db.aliased(User), db.aliased(User)
+    query = db.session.query(
+        DuplicateCandidate.id, DuplicateCandidate.user_id, first.name.label('user_name'),
+        DuplicateCandidate.other_id, other.name.label('other_name'),
+        DuplicateCandidate.score, DuplicateCandidate.status
+    ).outerjoin(first, first.id == DuplicateCandidate.user_id).outerjoin(
+        other, other.id == DuplicateCandidate.other_id  # merged-away users are gone
+    ).filter(DuplicateCandidate.status == request.args.get('status', 'open'))
+    return list_response(query, DuplicateCandidate.id, serialize_duplicate_row)
+
+@app.route('/api/users/duplicates/<int:candidate_id>/dismiss', methods=['POST'])
+@login_required
+@role_required(['Admin', 'Sysadmin'])
+def dismiss_duplicate(candidate_id):
+    candidate = db.session.get(DuplicateCandidate, candidate_id)
+    if candidate is None:
+        return jsonify({'success': False, 'message': 'Candidate not found'}), 404
+    candidate.status = 'dismissed'
+    db.session.commit()
+    log_audit(session['user_id'], 'DISMISS_DUPLICATE',
+              f'Users {candidate.user_id} and {candidate.other_id} are not duplicates', request.remote_addr)
+    return jsonify({'success': True, 'message': 'Candidate dismissed'})
+
+@app.route('/api/users/merge', methods=['POST'])
+@login_required
+@role_required(['Admin', 'Sysadmin'])
+def merge_users():
+    """Merge patient `duplicateId` into `survivorId`."""
+    # Records, audit rows and the account (if the survivor has none) move over
+    data = request.json or {}
+    try:
+        survivor_id, duplicate_id = int(data['survivorId']), int(data['duplicateId'])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'survivorId and duplicateId are required'}), 400
+    if survivor_id == duplicate_id:
+        return jsonify({'success': False, 'message': 'Cannot merge a user into itself'}), 400
+    survivor, duplicate = db.session.get(User, survivor_id), db.session.get(User, duplicate_id)
+    if survivor is None or duplicate is None:
+        return jsonify({'success': False, 'message': 'User not found'}), 404
+
+    # Take both patients out of the coverage rollups, move the history over,
+    # then count the merged patient back in
+    deltas = {}
+    for cell in coverage_cells(survivor_id) + coverage_cells(duplicate_id):
+        deltas[cell] = deltas.get(cell, 0) - 1
+    disabled_account = None
+    if duplicate.account and survivor.account:
+        # One account per patient: keep the username reserved but unusable
+        disabled_account = duplicate.account
+        disabled_account.user = None
+        disabled_account.is_locked = True
+        disabled_account.lock_until = datetime.max
+    elif duplicate.account:
+        duplicate.account.user = survivor
+    if not survivor.identifier:
+        survivor.identifier = duplicate.identifier
+    db.session.execute(Record.__table__.update().where(Record.user_id == duplicate_id).values(user_id=survivor_id))
+    db.session.execute(AuditLog.__table__.update().where(AuditLog.user_id == duplicate_id).values(user_id=survivor_id))
+    for cell in coverage_cells(survivor_id):
+        deltas[cell] = deltas.get(cell, 0) + 1
+    _add_to_rollups(CoverageRollup, [
+        {'vaccine': vaccine, 'dose': dose, 'birth_year': birth_year,
+         'period_year': period_year, 'patients': delta}
+        for (vaccine, dose, birth_year, period_year), delta in deltas.items() if delta
+    ])
+    _add_to_rollups(PopulationRollup, [{'birth_year': duplicate.dob.year, 'patients': -1}])
+
+    db.session.execute(DueDose.__table__.delete().where(DueDose.user_id == duplicate_id))
+    db.session.execute(UserMatchKey.__table__.delete().where(UserMatchKey.user_id == duplicate_id))
+    pair = (min(survivor_id, duplicate_id), max(survivor_id, duplicate_id))
+    candidates = DuplicateCandidate.__table__
+    db.session.execute(candidates.update().where(
+        candidates.c.user_id == pair[0], candidates.c.other_id == pair[1]).values(status='merged'))
+    db.session.execute(candidates.delete().where(
+        (candidates.c.user_id == duplicate_id) | (candidates.c.other_id == duplicate_id),
+        candidates.c.status != 'merged'))
+    db.session.delete(duplicate)
+    db.session.flush()
+    recompute_due_doses([survivor_id])
+    find_duplicates([survivor_id])
+    db.session.commit()
+
+    details = f'Merged user {duplicate_id} into user {survivor_id}'
+    if disabled_account is not None:
+        details += f'; disabled account {disabled_account.username}'
+    log_audit(session['user_id'], 'MERGE_USER', details, request.remote_addr)
+    return jsonify({'success': True, 'message': 'Users merged', 'userId': survivor_id,
+                    'disabledAccount': disabled_account.username if disabled_account else None})
 
 @app.route('/api/records', methods=['GET'])
 @login_required
+@cached_response('record', 'user')
 def get_records():
-    current_user = Account.query.filter_by(user_id=session['user_id']).first()
+    current_user = get_current_account()
     
+    # ?include=user adds the patient's name and dob, joined in the same query
+    if request.args.get('include') == 'user':
+        query = db.session.query(*RECORD_COLUMNS, *RECORD_USER_COLUMNS).join(User, User.id == Record.user_id)
+    else:
+        query = db.session.query(*RECORD_COLUMNS)
+
     # Regular users can only see their own records
     if current_user.role == 'User':
-        records = Record.query.filter_by(user_id=session['user_id']).all()
-    else:
-        records = Record.query.all()
-    
-    return jsonify([{
-        'id': record.id,
-        'userId': record.user_id,
-        'vaccine': record.vaccine,
-        'date': record.date.strftime('%Y-%m-%d'),
-        'dose': record.dose,
-        'filename': record.filename,
-        'uploader': record.uploader,
-        'timestamp': record.timestamp.strftime('%Y-%m-%d %H:%M:%S')
-    } for record in records])
+        query = query.filter(Record.user_id == session['user_id'])
+    return list_response(query, Record.id, row_to_dict)
 
 @app.route('/api/records', methods=['POST'])
 @login_required
 def add_record():
-    data = request.json
-    current_user = Account.query.filter_by(user_id=session['user_id']).first()
+    current_user = get_current_account()
+    # Same validation as bulk import; coerces userId and dose to integers
+    try:
+        values = parse_import_row(request.json)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     
     # Check if user has permission to add records for this user
-    if current_user.role == 'User' and data['userId'] != session['user_id']:
+    if current_user.role == 'User' and values['user_id'] != session['user_id']:
         return jsonify({'success': False, 'message': 'Permission denied'}), 403
+    if db.session.get(User, values['user_id']) is None:
+        return jsonify({'success': False, 'message': 'User not found'}), 404
     
-    record = Record(
-        user_id=data['userId'],
-        vaccine=data['vaccine'],
-        date=datetime.strptime(data['date'], '%Y-%m-%d'),
-        dose=data.get('dose'),
-        filename=data['filename'],
-        uploader=current_user.username
-    )
+    record = Record(uploader=current_user.username, **values)
+    update_coverage_rollups([{'user_id': record.user_id, 'vaccine': record.vaccine,
+                              'dose': record.dose, 'date': record.date}])
     db.session.add(record)
+    db.session.flush()
+    recompute_due_doses([record.user_id])
     db.session.commit()
     
     # Log record addition
-    log_audit(session['user_id'], 'ADD_RECORD', f'Added record for user {data["userId"]}', request.remote_addr)
+    log_audit(session['user_id'], 'ADD_RECORD', f'Added record for user {record.user_id}', request.remote_addr)
     
     return jsonify({'success': True, 'message': 'Record added successfully'})
 
+def parse_import_row(row):
+    """Validate one bulk-import row and return the values to insert.
+
+    Raises ValueError with a readable message when the row is invalid.
+    """
+    if not isinstance(row, dict):
+        raise ValueError('row must be an object')
+    try:
+        user_id = int(row.get('userId'))
+    except (TypeError, ValueError):
+        raise ValueError('userId must be an integer')
+    vaccine = (row.get('vaccine') or '').strip()
+    if not vaccine or len(vaccine) > 100:
+        raise ValueError('vaccine is required (max 100 characters)')
+    try:
+        record_date = datetime.strptime(row.get('date') or '', '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError('date must be YYYY-MM-DD')
+    dose = row.get('dose')
+    if dose in (None, ''):
+        dose = None
+    else:
+        try:
+            dose = int(dose)
+        except (TypeError, ValueError):
+            raise ValueError('dose must be an integer')
+    filename = row.get('filename') or None
+    if filename is not None and len(filename) > 255:
+        raise ValueError('filename is too long (max 255 characters)')
+    return {'user_id': user_id, 'vaccine': vaccine, 'date': record_date,
+            'dose': dose, 'filename': filename}
+
+def iter_import_rows(lines, fmt):
+    """Yield (line_number, row_dict_or_error) from a CSV or NDJSON line stream."""
+    if fmt == 'csv':
+        reader = csv.DictReader(line.decode('utf-8') for line in lines)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError:
+            yield line_number, ValueError('invalid JSON')
+
+@app.route('/api/records/import', methods=['POST'])
+@login_required
+@role_required(['Admin', 'Sysadmin', 'Frontdesk'])
+def import_records():
+    """Bulk-import records from a streamed CSV or NDJSON request body."""
+    # Fields as for POST /api/records; one transaction and audit entry per
+    # IMPORT_BATCH_SIZE rows, and invalid rows are reported and skipped
+    content_type = request.mimetype
+    fmt = request.args.get('format')
+    if fmt is None:
+        fmt = 'csv' if content_type == 'text/csv' else 'ndjson'
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'success': False, 'message': 'format must be csv or ndjson'}), 400
+
+    current_user = get_current_account()
+    imported = 0
+    rejected = 0
+    errors = []
+    batch = []
+
+    def reject(line_number, message):
+        nonlocal rejected
+        rejected += 1
+        if len(errors) < MAX_IMPORT_ERRORS:
+            errors.append({'line': line_number, 'error': message})
+
+    def flush():
+        nonlocal imported
+        # Check every referenced user exists with one query per batch
+        user_ids = {values['user_id'] for _, values in batch}
+        known = {row[0] for row in db.session.query(User.id).filter(User.id.in_(user_ids))}
+        rows = []
+        for line_number, values in batch:
+            if values['user_id'] in known:
+                values['uploader'] = current_user.username
+                values['timestamp'] = datetime.utcnow()
+                rows.append(values)
+            else:
+                reject(line_number, f"user {values['user_id']} does not exist")
+        if rows:
+            update_coverage_rollups(rows)
+            db.session.execute(Record.__table__.insert(), rows)
+            recompute_due_doses({row['user_id'] for row in rows})
+            db.session.commit()
+            imported += len(rows)
+            log_audit(session['user_id'], 'IMPORT_RECORDS',
+                      f'Imported {len(rows)} records (lines {batch[0][0]}-{batch[-1][0]})',
+                      request.remote_addr)
+        batch.clear()
+
+    try:
+        for line_number, row in iter_import_rows(request.stream, fmt):
+            if isinstance(row, ValueError):
+                reject(line_number, str(row))
+                continue
+            try:
+                batch.append((line_number, parse_import_row(row)))
+            except ValueError as e:
+                reject(line_number, str(e))
+                continue
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                flush()
+        if batch:
+            flush()
+    except (UnicodeDecodeError, csv.Error) as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'message': f'Could not read import body: {str(e)}',
+            'imported': imported,
+            'rejected': rejected,
+            'errors': errors
+        }), 400
+
+    return jsonify({
+        'success': True,
+        'imported': imported,
+        'rejected': rejected,
+        'errors': errors,
+        'errorsTruncated': rejected > len(errors)
+    })
+
+@app.route('/api/records/export', methods=['GET'])
+@login_required
+@role_required(['Admin', 'Sysadmin'])
+def export_records():
+    """Stream records as CSV or NDJSON, read in EXPORT_BATCH_SIZE chunks."""
+    # Filters: vaccine, user_id, from/to (inclusive); include=user adds name
+    # and dob, gzip=1 compresses on the fly
+    fmt = request.args.get('format', 'csv')
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'success': False, 'message': 'format must be csv or ndjson'}), 400
+    include_user = request.args.get('include') == 'user'
+    compress = request.args.get('gzip') in ('1', 'true')
+
+    columns = [Record.id, Record.user_id, Record.vaccine, Record.date, Record.dose,
+               Record.filename, Record.uploader, Record.timestamp]
+    field_names = list(EXPORT_COLUMNS)
+    if include_user:
+        columns += [User.name, User.dob]
+        field_names += EXPORT_USER_COLUMNS
+    stmt = select(*columns)
+    if include_user:
+        stmt = stmt.join(User, User.id == Record.user_id)
+    try:
+        if request.args.get('vaccine'):
+            stmt = stmt.where(Record.vaccine == request.args['vaccine'])
+        if request.args.get('user_id'):
+            stmt = stmt.where(Record.user_id == int(request.args['user_id']))
+        if request.args.get('from'):
+            stmt = stmt.where(Record.date >= datetime.strptime(request.args['from'], '%Y-%m-%d').date())
+        if request.args.get('to'):
+            stmt = stmt.where(Record.date <= datetime.strptime(request.args['to'], '%Y-%m-%d').date())
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid filter value'}), 400
+    stmt = stmt.order_by(Record.id).execution_options(stream_results=True)
+
+    def format_row(row):
+        values = list(row)
+        values[3] = values[3].strftime('%Y-%m-%d')
+        values[7] = values[7].strftime('%Y-%m-%d %H:%M:%S') if values[7] else None
+        if include_user:
+            values[9] = values[9].strftime('%Y-%m-%d')
+        return values
+
+    def generate_text():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if fmt == 'csv':
+            writer.writerow(field_names)
+            yield buffer.getvalue()
+        result = db.session.execute(stmt)
+        for rows in result.partitions(EXPORT_BATCH_SIZE):
+            buffer.seek(0)
+            buffer.truncate()
+            for row in rows:
+                if fmt == 'csv':
+                    writer.writerow(format_row(row))
+                else:
+                    buffer.write(json.dumps(dict(zip(field_names, format_row(row)))) + '\n')
+            yield buffer.getvalue()
+
+    def generate_gzip():
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31 = gzip container
+        for chunk in generate_text():
+            data = compressor.compress(chunk.encode('utf-8'))
+            if data:
+                yield data
+        yield compressor.flush()
+
+    extension = 'csv' if fmt == 'csv' else 'ndjson'
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    filename = f'records.{extension}'
+    body = generate_text()
+    if compress:
+        body = generate_gzip()
+        mimetype = 'application/gzip'
+        filename += '.gz'
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+@app.route('/api/due-doses', methods=['GET'])
+@login_required
+def get_due_doses():
+    """Doses due within `within` days (default 30), soonest first.
+
+    Overdue doses are included unless overdue=0. Regular users only see
+    their own. Pages hold `limit` rows; pass X-Next-Cursor back as `after`.
+    """
+    current_user = get_current_account()
+    today = date.today()
+    within = request.args.get('within', 30, type=int)
+    query = DueDose.query.filter(DueDose.due_date <= today + timedelta(days=within))
+    if request.args.get('overdue') == '0':
+        query = query.filter(DueDose.due_date >= today)
+    if current_user.role == 'User':
+        query = query.filter(DueDose.user_id == session['user_id'])
+    if request.args.get('after'):
+        try:
+            cursor_date, cursor_id = request.args['after'].rsplit('_', 1)
+            query = query.filter(tuple_(DueDose.due_date, DueDose.id) >
+                                 tuple_(datetime.strptime(cursor_date, '%Y-%m-%d').date(), int(cursor_id)))
+        except ValueError:
+            return jsonify({'success': False, 'message': 'Invalid cursor'}), 400
+
+    limit = max(1, min(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+    dues = query.order_by(DueDose.due_date, DueDose.id).limit(limit + 1).all()
+    has_more = len(dues) > limit
+    dues = dues[:limit]
+
+    response = jsonify([{
+        'id': due.id,
+        'userId': due.user_id,
+        'vaccine': due.vaccine,
+        'dose': due.dose,
+        'dueDate': due.due_date.strftime('%Y-%m-%d')
+    } for due in dues])
+    if has_more:
+        response.headers['X-Next-Cursor'] = f"{dues[-1].due_date.strftime('%Y-%m-%d')}_{dues[-1].id}"
+    return response
+
+@app.route('/api/analytics/coverage', methods=['GET'])
+@login_required
+@role_required(['Admin', 'Sysadmin'])
+@cached_response('coverage_rollup', 'population_rollup')
+def get_coverage():
+    """Share of patients born in [born_from, born_to] with `dose` of `vaccine`."""
+    # period_from/period_to limit the doses counted, group_by=birth_year|period
+    # adds a breakdown; served from the rollups, so records don't add cost
+    vaccine = request.args.get('vaccine')
+    dose = request.args.get('dose', type=int)
+    if not vaccine or dose is None:
+        return jsonify({'success': False, 'message': 'vaccine and dose are required'}), 400
+    born_from = request.args.get('born_from', type=int)
+    born_to = request.args.get('born_to', type=int)
+    period_from = request.args.get('period_from', type=int)
+    period_to = request.args.get('period_to', type=int)
+    group_by = request.args.get('group_by')
+    if group_by not in (None, 'birth_year', 'period'):
+        return jsonify({'success': False, 'message': 'group_by must be birth_year or period'}), 400
+
+    coverage = CoverageRollup.query.filter_by(vaccine=vaccine, dose=dose)
+    population = PopulationRollup.query
+    if born_from is not None:
+        coverage = coverage.filter(CoverageRollup.birth_year >= born_from)
+        population = population.filter(PopulationRollup.birth_year >= born_from)
+    if born_to is not None:
+        coverage = coverage.filter(CoverageRollup.birth_year <= born_to)
+        population = population.filter(PopulationRollup.birth_year <= born_to)
+    if period_from is not None:
+        coverage = coverage.filter(CoverageRollup.period_year >= period_from)
+    if period_to is not None:
+        coverage = coverage.filter(CoverageRollup.period_year <= period_to)
+
+    cells = coverage.all()
+    born = {row.birth_year: row.patients for row in population}
+    patients = sum(born.values())
+    vaccinated = sum(cell.patients for cell in cells)
+    result = {
+        'vaccine': vaccine,
+        'dose': dose,
+        'patients': patients,
+        'vaccinated': vaccinated,
+        'coverage': round(vaccinated / patients, 4) if patients else None
+    }
+
+    if group_by == 'birth_year':
+        by_year = {}
+        for cell in cells:
+            by_year[cell.birth_year] = by_year.get(cell.birth_year, 0) + cell.patients
+        result['breakdown'] = [{
+            'birthYear': year,
+            'patients': born.get(year, 0),
+            'vaccinated': by_year.get(year, 0),
+            'coverage': round(by_year.get(year, 0) / born[year], 4) if born.get(year) else None
+        } for year in sorted(born)]
+    elif group_by == 'period':
+        by_period = {}
+        for cell in cells:
+            by_period[cell.period_year] = by_period.get(cell.period_year, 0) + cell.patients
+        result['breakdown'] = [{'period': year, 'vaccinated': by_period[year]}
+                               for year in sorted(by_period)]
+    return jsonify(result)
+
 @app.route('/api/audit-logs', methods=['GET'])
 @login_required
 @role_required(['Sysadmin'])
+@cached_response('audit_log', 'audit_segment')
 def get_audit_logs():
-    logs = AuditLog.query.order_by(AuditLog.timestamp.desc()).limit(100).all()
-    return jsonify([{
-        'id': log.id,
-        'user_id': log.user_id,
-        'action': log.action,
-        'details': log.details,
-        'ip_address': log.ip_address,
-        'timestamp': log.timestamp.strftime('%Y-%m-%d %H:%M:%S')
-    } for log in logs])
+    """Newest-first audit log search over live and archived rows; pass X-Next-Cursor back as `before`."""
+    # Filters: user_id, action, ip, start (inclusive), end (exclusive)
+    # The raw timestamp rides along (unserialized) to build the cursor
+    query = db.session.query(*AUDIT_LOG_COLUMNS, AuditLog.timestamp.label('cursor_timestamp'))
+    filters = {}
+    try:
+        if request.args.get('user_id') is not None:
+            filters['user_id'] = int(request.args['user_id'])
+            query = query.filter(AuditLog.user_id == filters['user_id'])
+        if request.args.get('action'):
+            filters['action'] = request.args['action']
+            query = query.filter(AuditLog.action == filters['action'])
+        if request.args.get('ip'):
+            filters['ip'] = request.args['ip']
+            query = query.filter(AuditLog.ip_address == filters['ip'])
+        if request.args.get('start'):
+            filters['start'] = datetime.fromisoformat(request.args['start'])
+            query = query.filter(AuditLog.timestamp >= filters['start'])
+        if request.args.get('end'):
+            filters['end'] = datetime.fromisoformat(request.args['end'])
+            query = query.filter(AuditLog.timestamp < filters['end'])
+        if request.args.get('before'):
+            cursor_time, cursor_id = request.args['before'].rsplit('_', 1)
+            filters['before'] = (datetime.fromisoformat(cursor_time), int(cursor_id))
+            query = query.filter(tuple_(AuditLog.timestamp, AuditLog.id) <
+                                 tuple_(*filters['before']))
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid filter or cursor'}), 400
+
+    limit = max(1, min(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+    logs = query.order_by(AuditLog.timestamp.desc(), AuditLog.id.desc()).limit(limit + 1).all()
+    keys = [column.key for column in AUDIT_LOG_COLUMNS]
+    page = [((format_timestamp(log.cursor_timestamp), log.id), dict(zip(keys, log))) for log in logs]
+    # Only archived rows newer than the last live row could change this page
+    floor = (logs[-1].cursor_timestamp, logs[-1].id) if len(logs) > limit else None
+    archived = search_audit_archive(floor=floor, limit=limit + 1, **filters)
+    if archived:
+        page = sorted(page + [(key, {
+            'id': row[0], 'user_id': row[1], 'action': row[2], 'details': row[3],
+            'ip_address': row[4], 'timestamp': row[5][:19]
+        }) for key, row in archived], key=lambda item: item[0], reverse=True)
+    has_more = len(page) > limit
+    page = page[:limit]
+
+    response = encoded_response([log for _, log in page])
+    if has_more:
+        cursor_time, cursor_id = page[-1][0]
+        response.headers['X-Next-Cursor'] = f"{cursor_time.replace(' ', 'T')}_{cursor_id}"
+    return response
 
 if __name__ == '__main__':
     try:
@@ -0,0 +1,114 @@
+"""Compressed, time-partitioned archive segments for old audit log rows.
+
+A segment is a gzip file of JSON lines, one audit row per line as
+[id, user_id, action, details, ip_address, timestamp], sorted newest first
+so a reader can stop as soon as it has enough rows. Timestamps are stored
+as fixed-width "YYYY-MM-DD HH:MM:SS.ffffff" strings, which sort and compare
+like the datetimes they represent.
+
+Each segment gets a small index (see `summarize`): its time and id range,
+row count, the distinct actions, and Bloom filters over user ids and IP
+addresses. Readers use the index to skip segments that cannot contain a
+match without opening them.
+"""
+import gzip
+import hashlib
+import json
+import math
+import os
+from datetime import datetime
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+BLOOM_FALSE_POSITIVE_RATE = 0.01
+BLOOM_MIN_BITS = 64
+
+
+def format_timestamp(value):
+    return value.strftime(TIMESTAMP_FORMAT)
+
+
+def parse_timestamp(value):
+    return datetime.strptime(value, TIMESTAMP_FORMAT)
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings, serializable to bytes.
+
+    The first two bytes hold the number of hash functions; the rest is the
+    bit array.
+    """
+
+    def __init__(self, bits, hashes):
+        self.bits = bits
+        self.hashes = hashes
+        self.size = len(bits) * 8
+
+    @classmethod
+    def for_items(cls, items, false_positive_rate=BLOOM_FALSE_POSITIVE_RATE):
+        items = set(items)
+        n = max(len(items), 1)
+        size = max(BLOOM_MIN_BITS, int(-n * math.log(false_positive_rate) / math.log(2) ** 2))
+        hashes = max(1, round(size / n * math.log(2)))
+        bloom = cls(bytearray((size + 7) // 8), hashes)
+        for item in items:
+            bloom.add(item)
+        return bloom
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(bytearray(data[2:]), int.from_bytes(data[:2], 'big'))
+
+    def to_bytes(self):
+        return self.hashes.to_bytes(2, 'big') + bytes(self.bits)
+
+    def _positions(self, item):
+        # Double hashing: two 64-bit halves of one digest give every position
+        digest = hashlib.blake2b(str(item).encode(), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], 'big'), int.from_bytes(digest[8:], 'big') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+def summarize(rows):
+    """Index entry for a segment of rows (newest first, as written)."""
+    return {
+        'min_timestamp': parse_timestamp(rows[-1][5]),
+        'max_timestamp': parse_timestamp(rows[0][5]),
+        'min_id': min(row[0] for row in rows),
+        'max_id': max(row[0] for row in rows),
+        'row_count': len(rows),
+        'actions': json.dumps(sorted({row[2] for row in rows})),
+        'user_bloom': BloomFilter.for_items(row[1] for row in rows).to_bytes(),
+        'ip_bloom': BloomFilter.for_items(row[4] for row in rows).to_bytes(),
+    }
+
+
+def write_segment(path, rows, compresslevel=6):
+    """Atomically write `rows` (sorted newest first) to a gzip segment at `path`.
+
+    The file is fsynced before it is renamed into place, so a segment that
+    exists is complete. Returns its size in bytes.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=compresslevel, mtime=0) as f:
+            for row in rows:
+                f.write(json.dumps(row, separators=(',', ':')).encode() + b'\n')
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp_path, path)
+    return os.path.getsize(path)
+
+
+def read_segment(path):
+    """Yield a segment's rows, newest first."""
+    with gzip.open(path, 'rb') as f:
+        for line in f:
+            yield json.loads(line)
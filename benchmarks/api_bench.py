@@ -0,0 +1,182 @@
+"""Load test for the main API endpoints.
+
+Seeds a throwaway SQLite database, serves app.py on a local port with the
+threaded werkzeug server and drives each scenario with --concurrency client
+threads. For every endpoint it reports p50/p95/p99 latency, throughput and
+the mean number of SQL statements per request. Results can be saved as JSON
+and compared against a stored baseline:
+
+    python benchmarks/api_bench.py --save baseline.json
+    python benchmarks/api_bench.py --baseline baseline.json --threshold 0.2
+
+The comparison exits with status 1 when any endpoint's p95 latency grows, or
+its throughput drops, by more than the threshold.
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import g, request
+from werkzeug.serving import make_server
+
+from common import Client, load_app, percentile, seed
+
+# name -> (account to log in as, method, path); bodies come from build_body()
+SCENARIOS = {
+    'login': ('user1', 'POST', '/api/login'),
+    'list_records': ('frontdesk', 'GET', '/api/records?limit=100'),
+    'list_users': ('admin', 'GET', '/api/users?limit=100'),
+    'add_record': ('admin', 'POST', '/api/records'),
+    'import': ('admin', 'POST', '/api/records/import'),
+    'audit_logs': ('sysadmin', 'GET', '/api/audit-logs?limit=100'),
+}
+
+
+def build_body(name, rng, users):
+    if name == 'login':
+        return json.dumps({'username': f'user{rng.randint(1, users)}', 'password': 'password'}).encode(), 'application/json'
+    if name == 'add_record':
+        return json.dumps({
+            'userId': rng.randint(1, users), 'vaccine': 'MMR', 'date': '2020-01-01',
+            'dose': rng.randint(1, 2), 'filename': 'bench.pdf'
+        }).encode(), 'application/json'
+    if name == 'import':
+        lines = ['userId,vaccine,date,dose,filename']
+        lines += [f'{rng.randint(1, users)},Polio,2021-05-01,1,bench.pdf' for _ in range(100)]
+        return ('\n'.join(lines) + '\n').encode(), 'text/csv'
+    return None, None
+
+
+def install_query_counter(server, counts):
+    """Record the number of SQL statements issued by each request, per endpoint.
+
+    Reads the per-request g.sql_count maintained by the app's instrumentation.
+    """
+    lock = threading.Lock()
+
+    @server.app.after_request
+    def store_count(response):
+        with lock:
+            counts.setdefault(request.endpoint, []).append(g.get('sql_count', 0))
+        return response
+
+
+def run_scenario(base_url, name, requests, concurrency, users, seed_value):
+    username, method, path = SCENARIOS[name]
+    # One client per thread, logged in before the clock starts so throughput
+    # measures the endpoint rather than password hashing
+    clients = [Client(base_url) for _ in range(concurrency)]
+    if name != 'login':
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(lambda client: client.login(username), clients))
+
+    def worker(t):
+        client, rng = clients[t], random.Random(seed_value * 1000 + t)
+        timings = []
+        for _ in range(t, requests, concurrency):
+            body, content_type = build_body(name, rng, users)
+            start = time.perf_counter()
+            status = client.call(method, path, body, content_type)
+            timings.append((time.perf_counter() - start, status))
+        return timings
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = [result for timings in pool.map(worker, range(concurrency)) for result in timings]
+    wall = time.perf_counter() - started
+
+    latencies = [elapsed for elapsed, _ in results]
+    errors = sum(1 for _, status in results if status >= 400)
+    return {
+        'requests': requests,
+        'errors': errors,
+        'throughput': requests / wall,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+    }
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, current in results['endpoints'].items():
+        previous = baseline.get('endpoints', {}).get(name)
+        if not previous:
+            continue
+        if current['p95_ms'] > previous['p95_ms'] * (1 + threshold):
+            regressions.append(f"{name}: p95 {previous['p95_ms']:.1f} -> {current['p95_ms']:.1f} ms")
+        if current['throughput'] < previous['throughput'] * (1 - threshold):
+            regressions.append(f"{name}: throughput {previous['throughput']:.1f} -> {current['throughput']:.1f} req/s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--records', type=int, default=20000)
+    parser.add_argument('--audit-logs', type=int, default=50000)
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario')
+    parser.add_argument('--login-requests', type=int, default=20,
+                        help='requests for the login scenario (password hashing is slow)')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--save', help='write results to this JSON file')
+    parser.add_argument('--baseline', help='compare against this JSON results file')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='allowed relative regression (0.2 = 20%%)')
+    args = parser.parse_args()
+
+    server = load_app('api-bench-')
+    seed(server, users=args.users, records=args.records, audit_logs=args.audit_logs,
+         random_seed=args.seed)
+    query_counts = {}
+    install_query_counter(server, query_counts)
+
+    httpd = make_server('127.0.0.1', 0, server.app, threaded=True)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{httpd.server_port}'
+
+    results = {'config': vars(args).copy(), 'endpoints': {}}
+    for key in ('save', 'baseline'):
+        results['config'].pop(key)
+
+    print(f"{'endpoint':<14} {'req':>5} {'err':>4} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8}")
+    for name in args.scenarios.split(','):
+        requests = args.login_requests if name == 'login' else args.requests
+        query_counts.clear()
+        stats = run_scenario(base_url, name, requests, args.concurrency, args.users, args.seed)
+        counts = [n for endpoint, values in query_counts.items()
+                  if endpoint != 'login' or name == 'login' for n in values]
+        stats['queries_per_request'] = sum(counts) / len(counts) if counts else 0
+        results['endpoints'][name] = stats
+        print(f"{name:<14} {stats['requests']:>5} {stats['errors']:>4} {stats['throughput']:>8.1f} "
+              f"{stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f} {stats['p99_ms']:>8.1f} "
+              f"{stats['queries_per_request']:>8.1f}")
+
+    httpd.shutdown()
+    server.audit_writer.stop()
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved results to {args.save}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"Regressions beyond {args.threshold:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
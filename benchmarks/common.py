@@ -0,0 +1,77 @@
+"""Shared helpers for the benchmark scripts."""
+import http.cookiejar
+import json
+import os
+import sys
+import tempfile
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STAFF_ROLES = ['Admin', 'Sysadmin', 'Frontdesk']
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    if not samples:
+        return 0.0
+    index = min(len(samples) - 1, int(round(pct / 100.0 * (len(samples) - 1))))
+    return samples[index]
+
+
+class Client:
+    """HTTP client with its own cookie jar, i.e. its own session."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def call(self, method, path, body=None, content_type=None):
+        req = urllib.request.Request(self.base_url + path, data=body, method=method)
+        if content_type:
+            req.add_header('Content-Type', content_type)
+        try:
+            with self.opener.open(req) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+    def login(self, username):
+        return self.call('POST', '/api/login', json.dumps(
+            {'username': username, 'password': 'password'}).encode(), 'application/json')
+
+
+def load_app(prefix):
+    """Import app.py pointed at a fresh SQLite database in a temp directory."""
+    workdir = tempfile.mkdtemp(prefix=prefix)
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+    # Every client connects from 127.0.0.1; keep login throttling out of the way
+    os.environ.setdefault('LOGIN_IP_BURST', '1000000')
+    os.environ.setdefault('LOGIN_USER_BURST', '1000000')
+    sys.path.insert(0, ROOT)
+    import app as server
+    return server
+
+
+def seed(server, users=1000, records=0, audit_logs=0, random_seed=42):
+    """Seed the benchmark database and create staff accounts.
+
+    Staff accounts (admin, sysadmin, frontdesk; password "password") get
+    their own User rows so their audit entries carry a user_id.
+    """
+    with server.app.app_context():
+        server.db.create_all()
+        server.run_migrations()
+        server.seed_database(users=users, records=records, audit_logs=audit_logs,
+                             seed=random_seed)
+        password_hash = server.password_hasher.hash('password')
+        for role in STAFF_ROLES:
+            staff = server.User(name=f'Benchmark {role}', dob=server.date(1980, 1, 1))
+            server.db.session.add(staff)
+            server.db.session.flush()
+            server.db.session.add(server.Account(
+                username=role.lower(), password_hash=password_hash, role=role, user_id=staff.id))
+        server.db.session.commit()
@@ -0,0 +1,64 @@
+"""Bulk record import throughput.
+
+Seeds a throwaway SQLite database, then streams --rows generated records
+through POST /api/records/import as CSV or NDJSON and reports rows/second.
+
+    python benchmarks/import_bench.py --rows 200000 --format csv
+"""
+import argparse
+import json
+import random
+import time
+
+from common import load_app, seed
+
+
+def generate_lines(rows, users, fmt, seed):
+    rng = random.Random(seed)
+    if fmt == 'csv':
+        yield b'userId,vaccine,date,dose,filename\n'
+    for _ in range(rows):
+        row = {
+            'userId': rng.randint(1, users),
+            'vaccine': rng.choice(['MMR', 'DTaP', 'Polio', 'Influenza']),
+            'date': f"20{rng.randint(10, 24)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            'dose': rng.randint(1, 3),
+            'filename': 'import.pdf'
+        }
+        if fmt == 'csv':
+            yield f"{row['userId']},{row['vaccine']},{row['date']},{row['dose']},{row['filename']}\n".encode()
+        else:
+            yield (json.dumps(row) + '\n').encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--format', choices=['csv', 'ndjson'], default='csv')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    server = load_app('import-bench-')
+    seed(server, users=args.users, random_seed=args.seed)
+
+    client = server.app.test_client()
+    client.post('/api/login', json={'username': 'admin', 'password': 'password'})
+
+    body = b''.join(generate_lines(args.rows, args.users, args.format, args.seed))
+    content_type = 'text/csv' if args.format == 'csv' else 'application/x-ndjson'
+    started = time.perf_counter()
+    response = client.post('/api/records/import', data=body, content_type=content_type)
+    elapsed = time.perf_counter() - started
+    result = response.get_json()
+
+    print(f"status:      {response.status_code}")
+    print(f"imported:    {result['imported']}  rejected: {result['rejected']}")
+    print(f"elapsed:     {elapsed:.2f} s")
+    print(f"throughput:  {result['imported'] / elapsed:,.0f} rows/s ({args.format})")
+
+    server.audit_writer.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""Login latency under concurrent load.
+
+Serves the Flask app on a local port with a fixed pool of --threads request
+threads (like a gunicorn gthread worker) against a throwaway SQLite database,
+fires --requests logins from --concurrency client threads and reports
+p50/p99 latency and throughput. While the logins run, one client keeps
+polling GET /api/records so you can see whether cheap requests are starved
+of request threads by password hashing.
+
+    python benchmarks/login_bench.py --concurrency 32 --requests 500 --threads 8
+"""
+import argparse
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from werkzeug.serving import BaseWSGIServer
+
+from common import Client, load_app, percentile
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """werkzeug server that handles connections on a fixed number of threads."""
+
+    def __init__(self, host, port, app, threads):
+        super().__init__(host, port, app)
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='request')
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--accounts', type=int, default=50)
+    parser.add_argument('--threads', type=int, default=8, help='request threads (WORKER_THREADS)')
+    args = parser.parse_args()
+
+    # The app sizes its password-hash queue from WORKER_THREADS
+    os.environ['WORKER_THREADS'] = str(args.threads)
+    server = load_app('login-bench-')
+
+    with server.app.app_context():
+        server.db.create_all()
+        password_hash = server.password_hasher.hash('password')
+        for i in range(args.accounts):
+            user = server.User(name=f'Bench User {i}', dob=date(1990, 1, 1))
+            server.db.session.add(user)
+            server.db.session.flush()
+            server.db.session.add(server.Account(
+                username=f'bench{i}', password_hash=password_hash, role='User', user_id=user.id))
+        server.db.session.commit()
+
+    httpd = PooledWSGIServer('127.0.0.1', 0, server.app, args.threads)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{httpd.server_port}'
+
+    def login(i):
+        client = Client(base_url)
+        start = time.perf_counter()
+        status = client.login(f'bench{i % args.accounts}')
+        return time.perf_counter() - start, status
+
+    # Background poller measuring a cheap authenticated request
+    stop = threading.Event()
+    poll_latencies = []
+
+    def poll():
+        client = Client(base_url)
+        client.login('bench0')
+        while not stop.is_set():
+            start = time.perf_counter()
+            client.call('GET', '/api/records?limit=10')
+            poll_latencies.append(time.perf_counter() - start)
+
+    poller = threading.Thread(target=poll, daemon=True)
+    poller.start()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(login, range(args.requests)))
+    wall = time.perf_counter() - started
+    stop.set()
+    poller.join()
+
+    latencies = [elapsed for elapsed, _ in results]
+    statuses = {}
+    for _, status in results:
+        statuses[status] = statuses.get(status, 0) + 1
+
+    print(f"logins:        {args.requests} @ concurrency {args.concurrency}, {args.threads} request threads")
+    print(f"status codes:  {statuses}")
+    print(f"throughput:    {args.requests / wall:.1f} logins/s")
+    print(f"login p50:     {percentile(latencies, 50) * 1000:.1f} ms")
+    print(f"login p99:     {percentile(latencies, 99) * 1000:.1f} ms")
+    print(f"login mean:    {statistics.mean(latencies) * 1000:.1f} ms")
+    if poll_latencies:
+        print(f"records p50:   {percentile(poll_latencies, 50) * 1000:.1f} ms "
+              f"({len(poll_latencies)} polls during the run)")
+        print(f"records p99:   {percentile(poll_latencies, 99) * 1000:.1f} ms")
+
+    httpd.shutdown()
+    server.audit_writer.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Check that list endpoints issue the same number of SQL statements at any size.
+
+Seeds a throwaway SQLite database with --small users (three records each),
+counts the statements each listing issues, grows the database to --large
+users and counts again. Exits with status 1 if any count changed, i.e. if a
+listing went back to loading owners or accounts one row at a time (N+1):
+
+    python benchmarks/query_count_check.py --small 10 --large 100000
+"""
+import argparse
+import sys
+
+from flask import g
+
+from common import load_app, seed
+
+PATHS = [
+    '/api/users',
+    '/api/users?limit=100',
+    '/api/records?include=user',
+    '/api/records?include=user&limit=100',
+]
+
+
+def count_queries(server, client):
+    client.get('/api/users?limit=1')  # load the session principal into its cache
+    counts = {}
+    for path in PATHS:
+        # Count a full build of the body, not a cache hit
+        server.response_cache.clear()
+        response = client.get(path)
+        assert response.status_code == 200, (path, response.status_code)
+        response.get_data()
+        counts[path] = client.last_sql_count
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--small', type=int, default=10)
+    parser.add_argument('--large', type=int, default=100000)
+    args = parser.parse_args()
+
+    server = load_app('query-count-')
+    seed(server, users=args.small, records=args.small * 3)
+
+    # Large listings take longer than the principal TTL; don't count reloads
+    server.principal_cache.ttl = 3600
+    client = server.app.test_client()
+
+    @server.app.after_request
+    def store_count(response):
+        client.last_sql_count = g.get('sql_count', 0)
+        return response
+
+    client.post('/api/login', json={'username': 'admin', 'password': 'password'})
+    small = count_queries(server, client)
+
+    with server.app.app_context():
+        grow = args.large - args.small
+        server.seed_database(users=grow, records=grow * 3, seed=1)
+    large = count_queries(server, client)
+    server.audit_writer.stop()
+
+    failed = False
+    print(f"{'path':<40} {args.small:>8} {args.large:>8}")
+    for path in PATHS:
+        flag = '' if small[path] == large[path] else '  CHANGED'
+        failed = failed or bool(flag)
+        print(f"{path:<40} {small[path]:>8} {large[path]:>8}{flag}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
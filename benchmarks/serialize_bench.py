@@ -0,0 +1,76 @@
+"""List serialization: ORM objects + jsonify vs column rows + fast encoders.
+
+Seeds --rows records in a throwaway SQLite database, then builds the body of
+an unpaginated GET /api/records in each of these ways and reports the best
+of --repeat runs and the body size:
+
+    orm+jsonify      Record.query.all(), a dict per object with strftime,
+                     flask.jsonify (the previous implementation)
+    columns+json     RECORD_COLUMNS rows (dates formatted by SQLite), encoded
+                     with orjson if installed, else json
+    columns+msgpack  the same rows as MessagePack (needs msgpack)
+
+    python benchmarks/serialize_bench.py --rows 100000
+"""
+import argparse
+import time
+
+from flask import jsonify
+
+from common import load_app, seed
+
+
+def orm_jsonify(server):
+    records = server.Record.query.order_by(server.Record.id).all()
+    return jsonify([{
+        'id': record.id,
+        'userId': record.user_id,
+        'vaccine': record.vaccine,
+        'date': record.date.strftime('%Y-%m-%d'),
+        'dose': record.dose,
+        'filename': record.filename,
+        'uploader': record.uploader,
+        'timestamp': record.timestamp.strftime('%Y-%m-%d %H:%M:%S')
+    } for record in records]).get_data()
+
+
+def columns_encoded(server, mimetype):
+    from serialization import encode, row_to_dict
+    rows = server.db.session.query(*server.RECORD_COLUMNS).order_by(server.Record.id).all()
+    return encode([row_to_dict(row) for row in rows], mimetype)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    server = load_app('serialize-bench-')
+    seed(server, users=args.users, records=args.rows)
+    import serialization
+
+    paths = [('orm+jsonify', lambda: orm_jsonify(server)),
+             ('columns+json', lambda: columns_encoded(server, serialization.JSON))]
+    if serialization.msgpack is not None:
+        paths.append(('columns+msgpack', lambda: columns_encoded(server, serialization.MSGPACK)))
+    print(f"rows: {args.rows}, JSON encoder: {'orjson' if serialization.orjson else 'json'}")
+
+    with server.app.test_request_context():
+        baseline = None
+        for name, build in paths:
+            timings = []
+            for _ in range(args.repeat):
+                server.db.session.expunge_all()
+                start = time.perf_counter()
+                body = build()
+                timings.append(time.perf_counter() - start)
+            best = min(timings)
+            baseline = baseline or best
+            print(f"{name:<16} {best * 1000:>9.1f} ms  {len(body) / 1024:>9.0f} KiB  {baseline / best:>5.1f}x")
+    server.audit_writer.stop()
+
+
+if __name__ == '__main__':
+    main()
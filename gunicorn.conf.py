@@ -0,0 +1,25 @@
+"""Gunicorn settings for wsgi.py: one process per core, threads for I/O.
+
+Everything can be overridden from the environment, e.g.
+WEB_WORKERS=4 WORKER_THREADS=16 BIND=0.0.0.0:8000 gunicorn -c gunicorn.conf.py wsgi:app
+WORKER_THREADS also sizes each worker's connection pool (see DB_PROFILE in
+app.py). wsgi.py defaults LOG_MAX_BYTES to 0 because workers can't share
+rotation of app.log; rotate it externally (e.g. logrotate with copytruncate).
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '127.0.0.1:5000')
+workers = int(os.environ.get('WEB_WORKERS', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('WORKER_THREADS', 8))
+
+# Import and warm the app once in the master; workers are forked from it
+preload_app = True
+
+timeout = int(os.environ.get('WORKER_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers now and then to bound memory growth
+max_requests = int(os.environ.get('MAX_REQUESTS', 10000))
+max_requests_jitter = max_requests // 10
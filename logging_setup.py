@@ -0,0 +1,128 @@
+"""Non-blocking, structured application logging.
+
+Request threads only put records on a bounded in-memory queue; a background
+QueueListener thread formats them as JSON lines and writes them to a rotating
+file. Records are sampled per level before they are queued, sensitive fields
+are redacted, and when the queue is full new records are dropped (and
+counted) instead of blocking the request.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import time
+
+REDACTED = '[REDACTED]'
+SENSITIVE_KEYS = {'password', 'password_hash', 'token', 'access_token', 'secret', 'authorization'}
+SENSITIVE_PATTERN = re.compile(
+    r"""(['"]?(?:%s)['"]?\s*[:=]\s*)(['"])?[^,'"}\s]+\2?""" % '|'.join(sorted(SENSITIVE_KEYS)),
+    re.IGNORECASE)
+
+# Attributes every LogRecord has; anything else came in through `extra=`
+_STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def redact(value):
+    """Mask sensitive keys in dicts/lists and key=value pairs in strings."""
+    if isinstance(value, dict):
+        return {k: REDACTED if str(k).lower() in SENSITIVE_KEYS else redact(v)
+                for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(v) for v in value]
+    if isinstance(value, str):
+        return SENSITIVE_PATTERN.sub(lambda m: m.group(1) + REDACTED, value)
+    return value
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': redact(record.getMessage()),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and not key.startswith('_'):
+                entry[key] = REDACTED if key.lower() in SENSITIVE_KEYS else redact(value)
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep each record with the probability configured for its level."""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = {logging.getLevelName(level) if isinstance(level, str) else level: rate
+                      for level, rate in rates.items()}
+
+    def filter(self, record):
+        rate = self.rates.get(record.levelno, 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking when full."""
+
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
+
+
+def configure_logging(filename='app.log', level='INFO', sample_rates=None, queue_size=10000,
+                      max_bytes=10 * 1024 * 1024, backup_count=5, rotate_when=None):
+    """Install the queue-based JSON handler on the root logger.
+
+    rotate_when (e.g. "midnight") switches from size-based to time-based
+    rotation. Returns the QueueListener so callers can stop it. Processes
+    forked later (pre-fork servers) get their own queue and listener thread;
+    with several such workers leave rotation to an external tool
+    (max_bytes=0), since the file handlers don't coordinate across processes.
+    """
+    if rotate_when:
+        file_handler = logging.handlers.TimedRotatingFileHandler(
+            filename, when=rotate_when, backupCount=backup_count, delay=True)
+    else:
+        file_handler = logging.handlers.RotatingFileHandler(
+            filename, maxBytes=max_bytes, backupCount=backup_count, delay=True)
+    file_handler.setFormatter(JsonFormatter())
+
+    log_queue = queue.Queue(maxsize=queue_size)
+    queue_handler = DroppingQueueHandler(log_queue)
+    if sample_rates:
+        queue_handler.addFilter(SamplingFilter(sample_rates))
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+
+    listener = logging.handlers.QueueListener(log_queue, file_handler, respect_handler_level=True)
+    listener.start()
+
+    def flush_on_exit():
+        # Drain whatever is still queued; skip if the caller already stopped it
+        if listener._thread is not None:
+            listener.stop()
+    atexit.register(flush_on_exit)
+
+    def restart_in_child():
+        # A forked worker inherits the queue but not the listener thread (and
+        # possibly a queue lock held at fork time), so give it fresh ones
+        listener.queue = queue_handler.queue = queue.Queue(maxsize=queue_size)
+        listener._thread = None
+        listener.start()
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=restart_in_child)
+    return listener
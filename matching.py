@@ -0,0 +1,106 @@
+"""Duplicate-patient matching: blocking keys and pair scoring.
+
+Comparing every pair of patients is quadratic, so each patient is given a
+handful of blocking keys (phonetic name codes combined with the date of
+birth, identifier fragments). Only patients that share a key are compared,
+and each candidate pair is scored from name, dob and identifier similarity.
+"""
+import re
+import unicodedata
+from difflib import SequenceMatcher
+
+_SOUNDEX_CODES = {}
+for _letters, _digit in (('bfpv', '1'), ('cgjkqsxz', '2'), ('dt', '3'), ('l', '4'),
+                         ('mn', '5'), ('r', '6')):
+    for _letter in _letters:
+        _SOUNDEX_CODES[_letter] = _digit
+
+
+def normalize_name(name):
+    """Lower-case, strip accents and punctuation; return the list of words."""
+    name = unicodedata.normalize('NFKD', name or '')
+    name = ''.join(ch for ch in name if not unicodedata.combining(ch))
+    return re.findall(r'[a-z]+', name.lower())
+
+
+def normalize_identifier(identifier):
+    return re.sub(r'[^0-9A-Z]', '', (identifier or '').upper())
+
+
+def soundex(word):
+    """American Soundex code of `word` (e.g. "Robert" -> "R163")."""
+    word = ''.join(ch for ch in word.lower() if ch.isalpha())
+    if not word:
+        return ''
+    code = word[0].upper()
+    previous = _SOUNDEX_CODES.get(word[0], '')
+    for ch in word[1:]:
+        digit = _SOUNDEX_CODES.get(ch, '')
+        if digit and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        # h and w don't separate letters with the same code; vowels do
+        if ch not in 'hw':
+            previous = digit
+    return code.ljust(4, '0')
+
+
+def blocking_keys(name, dob, identifier=None):
+    """Return the set of blocking keys for one patient."""
+    words = normalize_name(name)
+    keys = set()
+    if words:
+        first, last = soundex(words[0]), soundex(words[-1])
+        # Sorted so that swapped given/family names land in the same block
+        pair = ''.join(sorted((first, last)))
+        keys.add(f'nd:{pair}:{dob.isoformat()}')
+        keys.add(f'ny:{pair}:{dob.year}')
+        keys.add(f'ld:{last}:{dob.isoformat()}')
+    ident = normalize_identifier(identifier)
+    if ident:
+        keys.add(f'id:{ident}')
+        if len(ident) > 4:
+            keys.add(f'if:{ident[-4:]}:{dob.year}')
+    return keys
+
+
+def name_similarity(a, b):
+    a, b = ' '.join(sorted(normalize_name(a))), ' '.join(sorted(normalize_name(b)))
+    if not a or not b:
+        return 0.0
+    return SequenceMatcher(None, a, b).ratio()
+
+
+def dob_similarity(a, b):
+    if a == b:
+        return 1.0
+    # Day and month swapped, or a single-field typo
+    if (a.year, a.month, a.day) == (b.year, b.day, b.month):
+        return 0.8
+    if sum((a.year == b.year, a.month == b.month, a.day == b.day)) == 2:
+        return 0.8
+    return 0.0
+
+
+def identifier_similarity(a, b):
+    a, b = normalize_identifier(a), normalize_identifier(b)
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+    if len(a) > 4 and a[-4:] == b[-4:]:
+        return 0.5
+    return 0.0
+
+
+def match_score(a, b, minimum=0.0):
+    """Score two patients (objects with name, dob, identifier) from 0 to 1.
+
+    Same name and dob with different identifiers scores 0.85. Pairs that
+    can't reach `minimum` skip the (slow) name comparison and score below it.
+    """
+    score = 0.35 * dob_similarity(a.dob, b.dob) + 0.15 * identifier_similarity(a.identifier, b.identifier)
+    if score + 0.5 < minimum:
+        return score
+    return score + 0.5 * name_similarity(a.name, b.name)
@@ -0,0 +1,51 @@
+"""Token-bucket rate limiting with a pluggable bucket store.
+
+A bucket holds up to `capacity` tokens and refills at `rate` tokens per
+second; each request takes one token and is refused when none are left.
+check() looks for a token without taking it, so a caller can take it with
+allow() later, e.g. only once an attempt has failed.
+MemoryBucketStore keeps buckets in-process (bounded, LRU-evicted); any
+object with the same take() method, e.g. one backed by Redis, can be
+dropped in to share limits between worker processes.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class MemoryBucketStore:
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate, now, cost=1):
+        """Take `cost` tokens from `key`'s bucket if it holds at least one.
+
+        cost=0 only checks. Returns (allowed, retry_after_seconds).
+        """
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - last) * rate)
+            if tokens >= 1:
+                allowed, tokens, retry_after = True, tokens - cost, 0.0
+            else:
+                allowed, retry_after = False, (1 - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return allowed, retry_after
+
+
+class TokenBucketLimiter:
+    def __init__(self, store, capacity, rate):
+        self.store = store
+        self.capacity = capacity
+        self.rate = rate
+
+    def allow(self, key):
+        return self.store.take(key, self.capacity, self.rate, time.monotonic())
+
+    def check(self, key):
+        """Like allow(), without taking a token."""
+        return self.store.take(key, self.capacity, self.rate, time.monotonic(), cost=0)
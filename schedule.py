@@ -0,0 +1,67 @@
+"""Vaccine schedule rules and next-due-date calculation.
+
+Rules are keyed by vaccine name (matched case-insensitively) and describe a
+dose series: how many doses, the minimum age for dose 1, the minimum gap
+between consecutive doses, and optionally the age after which an unstarted
+series is no longer offered.
+"""
+import json
+from collections import namedtuple
+from datetime import timedelta
+
+VaccineRule = namedtuple('VaccineRule', [
+    'series_length',    # number of doses in the primary series
+    'min_age_days',     # earliest age for dose 1
+    'intervals_days',   # minimum days between dose n and dose n+1
+    'max_start_age_days'  # None = no upper age limit for starting the series
+])
+
+DEFAULT_RULES = {
+    'Hepatitis B': VaccineRule(3, 0, [28, 56], None),
+    'DTaP': VaccineRule(5, 42, [28, 28, 180, 1095], 7 * 365),
+    'Polio': VaccineRule(4, 42, [28, 180, 1095], 18 * 365),
+    'MMR': VaccineRule(2, 365, [28], None),
+    'Varicella': VaccineRule(2, 365, [84], None),
+    'HPV': VaccineRule(2, 9 * 365, [180], 27 * 365),
+    'Influenza': VaccineRule(1, 180, [], None),
+    'COVID-19': VaccineRule(2, 180, [21], None),
+}
+
+def load_rules(path=None):
+    """Return the rule table, optionally replaced by a JSON file.
+
+    The file maps vaccine name to an object with the VaccineRule fields.
+    """
+    if not path:
+        return dict(DEFAULT_RULES)
+    with open(path) as f:
+        raw = json.load(f)
+    return {name: VaccineRule(**rule) for name, rule in raw.items()}
+
+def next_due(rule, dob, last_dose=None, last_date=None):
+    """Return (dose_number, due_date) for the next dose, or None if done.
+
+    `last_dose`/`last_date` describe the most recent dose given (None when the
+    series has not been started).
+    """
+    if not last_dose:
+        return 1, dob + timedelta(days=rule.min_age_days)
+    if last_dose >= rule.series_length:
+        return None
+    interval = rule.intervals_days[last_dose - 1] if last_dose - 1 < len(rule.intervals_days) else 0
+    return last_dose + 1, last_date + timedelta(days=interval)
+
+def due_doses(rules, dob, given, today):
+    """Yield (vaccine, dose_number, due_date) for one patient.
+
+    `given` maps lower-cased vaccine name to (last_dose, last_date). Unstarted
+    series past their max_start_age_days are skipped.
+    """
+    age_days = (today - dob).days
+    for vaccine, rule in rules.items():
+        last_dose, last_date = given.get(vaccine.lower(), (None, None))
+        if not last_dose and rule.max_start_age_days is not None and age_days > rule.max_start_age_days:
+            continue
+        due = next_due(rule, dob, last_dose, last_date)
+        if due is not None:
+            yield vaccine, due[0], due[1]
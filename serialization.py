@@ -0,0 +1,55 @@
+"""Encoding for list responses: JSON by default, MessagePack on request.
+
+List endpoints select plain column tuples (no ORM objects) and turn each
+row into a dict with `row_to_dict`. Bodies are encoded with orjson when it
+is installed (falling back to the json module), and with msgpack when the
+client sends `Accept: application/msgpack` and msgpack is installed. Dates
+that are still date/datetime objects are written as ISO 8601 strings.
+"""
+import json
+from datetime import date
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
+_MSGPACK_ALIASES = (MSGPACK, 'application/x-msgpack')
+
+
+def _default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f'Object of type {type(value).__name__} is not serializable')
+
+
+def row_to_dict(row):
+    """Turn a column-select Row into a dict keyed by column labels."""
+    return dict(zip(row._fields, row))
+
+
+def negotiate(accept):
+    """Pick JSON or MessagePack from a werkzeug MIMEAccept (JSON wins ties)."""
+    if msgpack is None:
+        return JSON
+    best = accept.best_match((JSON,) + _MSGPACK_ALIASES, default=JSON)
+    return MSGPACK if best in _MSGPACK_ALIASES else JSON
+
+
+def dumps_json(data):
+    if orjson is not None:
+        return orjson.dumps(data, default=_default)
+    return json.dumps(data, separators=(',', ':'), default=_default).encode()
+
+
+def encode(data, mimetype=JSON):
+    if mimetype == MSGPACK:
+        return msgpack.packb(data, default=_default, use_bin_type=True)
+    return dumps_json(data)
@@ -0,0 +1,22 @@
+"""Production entry point for app.py under a pre-fork WSGI server.
+
+    flask migrate                      # schema changes run once, at deploy
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+The master imports this module once (preload), refuses to start if the
+schema is behind, and warms the in-process caches; workers are then forked
+from it and open their own database connections. No DDL runs here or at
+worker start.
+"""
+import os
+
+os.environ.setdefault('DB_PROFILE', 'production')
+# Workers would each rotate the shared app.log; leave rotation to logrotate
+os.environ.setdefault('LOG_MAX_BYTES', '0')
+
+from app import app, schema_is_current, warm_up  # noqa: E402
+
+with app.app_context():
+    if not schema_is_current():
+        raise RuntimeError('Database schema is out of date; run "flask migrate" first')
+warm_up()